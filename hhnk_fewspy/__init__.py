@@ -22,3 +22,4 @@ from hhnk_fewspy.xml_functions import (
     xml_to_df,
     print_xml,
 )
+from hhnk_fewspy.xml_index import XmlIndex
@@ -1,23 +1,62 @@
 # %%
 import datetime
+import gzip
 import inspect
-from dataclasses import dataclass
+import io
+import json
+import sys
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
 from pathlib import Path
 from typing import Union
+from xml.sax.saxutils import quoteattr
 
 import hhnk_research_tools as hrt
 import numpy as np
 import pandas as pd
-from lxml import objectify
-
-# TODO bij wegschrijven max x events en anders opsplitsen naar meerdere bestanden.
-
+from lxml import etree
 
 DATETIME_KEYS = ["start_date", "end_date"]
+# Columns of the header catalogue (XmlFile.headers) and their dtype
+CATALOGUE_COLUMNS = {
+    "location_id": "object",
+    "parameter_id": "category",
+    "qualifier_ids": "object",
+    "module_instance_id": "category",
+    "type": "category",
+    "time_step": "category",
+    "start_date": "datetime",
+    "end_date": "datetime",
+    "time_zone": "float",
+    "miss_val": "float",
+    "units": "category",
+    "station_name": "object",
+    "lat": "float",
+    "lon": "float",
+    "x": "float",
+    "y": "float",
+    "z": "float",
+}
+# PI timestep units with a fixed duration in seconds, month and year are calendar units.
+TIME_STEP_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 604800}
+TIME_STEP_MONTHS = {"month": 1, "year": 12}
 FLOAT_KEYS = ["miss_val", "lat", "lon", "x", "y", "z"]
 EVENT_COLUMNS = ["datetime", "value", "flag"]
+# Optional PI event attributes and their column in XmlTimeSeries.df, in the order of the PI schema.
+EVENT_ATTRIBUTES = {"flag": "flag", "flagSource": "flag_source", "comment": "comment", "user": "user"}
+PI_NAMESPACE = "http://www.wldelft.nl/fews/PI"
+# Compression of an xml (or zip bundle of xml files) by suffix
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zip": "zip"}
+
+# Tags match with and without the PI namespace, like HEADER_TAGS.
+EVENT_TAG = "{*}event"
 
 TAB = "\t"
+# Number of events that are formatted at once when a series is written, this bounds the memory of a write.
+EVENT_CHUNK_SIZE = 100_000
 
 
 def camel_to_snake_case(camel_case: str) -> str:
@@ -31,6 +70,387 @@ def snake_to_camel_case(snake_case: str) -> str:
     return words[0] + "".join(i.title() for i in words[1:])
 
 
+def open_bin_values(binfile_path) -> np.ndarray:
+    """Open the values of a FEWS .bin file as a read-only memory map.
+
+    Nothing is read from disk until values are accessed, slices of the
+    returned array are views on the same map.
+    """
+    if Path(binfile_path).stat().st_size == 0:
+        return np.empty(0, dtype=np.float32)  # np.memmap cannot map empty files
+    return np.memmap(binfile_path, dtype=np.float32, mode="r")
+
+
+def read_bin_values(f) -> np.ndarray:
+    """Read the values of a FEWS .bin from a (decompressing) file object into memory.
+    A compressed .bin cannot be memory mapped, the values are read-only like open_bin_values.
+    """
+    return np.frombuffer(f.read(), dtype=np.float32)
+
+
+class BufferReader(io.RawIOBase):
+    """Read-only file object on a buffer (bytes, bytearray, memoryview, mmap).
+    The parser reads it in chunks, the buffer itself is never copied as a whole.
+    """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast("B")
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        size = min(len(b), len(self.view) - self.pos)
+        b[:size] = self.view[self.pos : self.pos + size]
+        self.pos += size
+        return size
+
+
+def infer_compression(path, compression="infer"):
+    """Compression of path, 'gzip', 'zip' or None. 'infer' derives it from the suffix."""
+    if compression == "infer":
+        return COMPRESSION_SUFFIXES.get(Path(path).suffix.lower())
+    if compression not in [None, *COMPRESSION_SUFFIXES.values()]:
+        raise ValueError(f"compression should be 'infer', 'gzip', 'zip' or None, got {compression}")
+    return compression
+
+
+def bin_output_path(path, compression="infer"):
+    """Path of the .bin that is written next to an xml, None when it is a member of a zip"""
+    path = Path(path)
+    compression = infer_compression(path, compression)
+    if compression == "zip":
+        return None
+    if compression == "gzip":
+        return path.with_suffix("").with_suffix(".bin.gz")
+    return path.with_suffix(".bin")
+
+
+@contextmanager
+def open_xml_writer(path, compression="infer"):
+    """Open the output of an xml, optionally compressed.
+
+    Yields open_output(suffix), which opens a buffered binary file to write the (utf-8)
+    xml (suffix '.xml') or the .bin (suffix '.bin') to. These are written one after the other:
+    - None: path and a .bin next to it.
+    - gzip: path and a .bin.gz next to it.
+    - zip: the members <stem>.xml and <stem>.bin of the zip, written while they are compressed.
+    """
+    path = Path(path)
+    compression = infer_compression(path, compression)
+    if compression == "zip":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            yield lambda suffix: archive.open(Path(path.stem).with_suffix(suffix).name, "w", force_zip64=True)
+        return
+
+    def open_output(suffix: str):
+        output_path = path if suffix == ".xml" else bin_output_path(path, compression)
+        return gzip.open(output_path, "wb") if compression == "gzip" else open(output_path, "wb")
+
+    yield open_output
+
+
+def format_miss_val(miss_val) -> str:
+    """MissVal as it is written in the header and for NaN event values (e.g. '-999.0').
+    NaN and no missVal are written as 'NaN', Java (so FEWS) does not read 'nan'.
+    miss_val (float, int, str): as in XmlHeader, a str is written as it is
+    """
+    if miss_val is None or np.isnan(float(miss_val)):
+        return "NaN"
+    return str(miss_val)
+
+
+def write_bin_values(f, values: np.ndarray, miss_val: float = None):
+    """Write values to a .bin file object as float32, NaN is written as miss_val.
+    Contiguous float32 values (e.g. a row of a TimeBlock) are written without a copy.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    miss_val = None if miss_val is None else float(miss_val)
+    if miss_val is not None and not np.isnan(miss_val) and np.isnan(values).any():
+        values = np.where(np.isnan(values), np.float32(miss_val), values)
+    f.write(np.ascontiguousarray(values).data)
+
+
+def bin_offsets(timesteps) -> np.ndarray:
+    """Offset table of series that are stored consecutively in a .bin.
+
+    The values of series i are bin_values[offsets[i] : offsets[i + 1]] and
+    offsets[-1] is the total number of values described by the headers.
+    """
+    offsets = np.zeros(len(timesteps) + 1, dtype=np.int64)
+    np.cumsum(timesteps, out=offsets[1:])
+    return offsets
+
+
+def parse_event_datetimes(datetimes: list) -> np.ndarray:
+    """Convert PI event datetimes ('2021-06-22T06:00:00') to datetime64.
+
+    The strings have a fixed ISO format, so they are parsed by numpy in one
+    vectorised call instead of format inference per value. Fractional seconds
+    of the time (xs:time, '06:00:00.500') are kept up to ms.
+    """
+    return np.array(datetimes, dtype="datetime64[ms]").astype("datetime64[ns]")
+
+
+def pi_time_zone(time_zone: float) -> datetime.timezone:
+    """Return the fixed offset of a PI <timeZone>, which is given in hours relative to UTC"""
+    return datetime.timezone(datetime.timedelta(hours=float(time_zone)))
+
+
+def localize_index(index: pd.DatetimeIndex, time_zone: float, tz="UTC") -> pd.DatetimeIndex:
+    """Naive index in the PI timeZone of the document to a tz-aware index in tz.
+    tz=None keeps the index naive, in the time zone of the document.
+    """
+    if tz is None:
+        return index
+    return index.tz_localize(pi_time_zone(time_zone)).tz_convert(tz)
+
+
+def delocalize_index(index: pd.DatetimeIndex, time_zone: float) -> pd.DatetimeIndex:
+    """Tz-aware index to a naive index in the PI timeZone that is written.
+    Naive indexes are assumed to be in that time zone already and are not shifted.
+    """
+    if index.tz is None:
+        return index
+    return index.tz_convert(pi_time_zone(time_zone)).tz_localize(None)
+
+
+def read_events(
+    series_element: etree._Element, start: pd.Timestamp = None, end: pd.Timestamp = None, dtype=np.float64
+) -> tuple:
+    """Read the events of a <series> element into numpy arrays.
+
+    start, end (pd.Timestamp): only read events in this time window. Events in a series are
+        chronological, so the window is cut on the parsed datetimes before any value is converted.
+
+    Returns
+    -------
+    index (pd.DatetimeIndex): event datetimes
+    values (np.ndarray): event values with dtype (default float64)
+    event_columns (dict): optional attributes (see EVENT_ATTRIBUTES) that are used in the series.
+        flag as uint8 array, flagSource, comment and user as pd.Categorical.
+    """
+    events = list(series_element.iterchildren(EVENT_TAG))
+    datetimes = parse_event_datetimes([f"{e.get('date')}T{e.get('time')}" for e in events])
+
+    if start is not None or end is not None:
+        i_start = 0 if start is None else datetimes.searchsorted(start.to_datetime64(), side="left")
+        i_end = len(events) if end is None else datetimes.searchsorted(end.to_datetime64(), side="right")
+        events = events[i_start:i_end]
+        datetimes = datetimes[i_start:i_end]
+
+    index = pd.DatetimeIndex(datetimes)
+
+    values = np.empty(len(events), dtype=dtype)
+    values[:] = [e.get("value") for e in events]  # numpy parses the str values directly
+
+    # Optional attributes, only events with more than date, time and value have them. The check
+    # stops at the first such event, else each attribute is read once and dropped when unused.
+    event_columns = {}
+    if not any(len(e.attrib) > 3 for e in events):
+        return index, values, event_columns
+    for attribute, column in EVENT_ATTRIBUTES.items():
+        attribute_values = [e.get(attribute) for e in events]
+        if attribute_values.count(None) == len(attribute_values):
+            continue  # attribute not used, no column
+        if attribute == "flag":
+            # missing flag is 0 (original reliable)
+            event_columns[column] = np.array([0 if f is None else f for f in attribute_values], dtype=np.uint8)
+        else:
+            event_columns[column] = pd.Categorical(attribute_values)
+    return index, values, event_columns
+
+
+def read_event_dates(series_element: etree._Element) -> pd.DatetimeIndex:
+    """Dates of the events of a <series>, without reading the values.
+    Used for nonequidistant binary series, where the values are in the .bin.
+    """
+    return pd.DatetimeIndex(
+        parse_event_datetimes([f"{e.get('date')}T{e.get('time')}" for e in series_element.iterchildren(EVENT_TAG)])
+    )
+
+
+def byte_rows(strings: np.ndarray) -> np.ndarray:
+    """View a bytes array (dtype S) as uint8 matrix with a NUL padded row per string, see join_byte_columns"""
+    return strings.view(np.uint8).reshape(len(strings), strings.dtype.itemsize)
+
+
+def byte_matrix(columns: list, n: int) -> np.ndarray:
+    """Fill the columns of n lines into one fixed width uint8 matrix, see join_byte_columns"""
+    widths = [len(c) if isinstance(c, bytes) else c.shape[1] for c in columns]
+    lines = np.empty((n, sum(widths)), dtype=np.uint8)
+    position = 0
+    for column, width in zip(columns, widths):
+        if isinstance(column, bytes):
+            column = np.frombuffer(column, dtype=np.uint8)
+        lines[:, position : position + width] = column
+        position += width
+    return lines
+
+
+def join_byte_columns(columns: list, n: int) -> bytes:
+    """Concatenate the columns of n lines into one bytes object.
+
+    columns (list): bytes that are the same on every line, or uint8 matrices with shape
+        (n, width) with the NUL padded bytes per line, see byte_rows.
+    The lines are filled as one fixed width matrix, the NUL padding is removed in one go.
+    """
+    lines = byte_matrix(columns, n).ravel()
+    return lines[lines != 0].tobytes()
+
+
+def format_event_datetimes(index: pd.DatetimeIndex) -> tuple:
+    """Format the date (b'2021-06-22') and time (b'06:00:00') of every event as byte rows.
+    Every distinct day and time of day is formatted once. When an event has fractional
+    seconds, all times are written with ms (b'06:00:00.500').
+    """
+    ns_per_day = TIME_STEP_SECONDS["day"] * 10**9
+    ns = index.as_unit("ns").asi8
+    days = ns // ns_per_day
+    day_codes, unique_days = pd.factorize(days)
+    ms = (ns - days * ns_per_day) // 10**6
+    unit = "ms" if (ms % 1000).any() else "s"
+    time_codes, unique_times = pd.factorize(ms if unit == "ms" else ms // 1000)
+
+    dates = np.datetime_as_string(unique_days.astype("datetime64[D]")).astype(bytes)
+    times = np.datetime_as_string(unique_times.astype(f"datetime64[{unit}]")).astype(bytes)  # 1970-01-01T06:00:00
+    return byte_rows(dates)[day_codes], byte_rows(times)[:, 11:][time_codes]
+
+
+def round_values(values: np.ndarray, decimals: int = None, significant_digits: int = None) -> np.ndarray:
+    """Round float values to a number of decimals, or to a number of significant digits per value.
+    Rounding to 3 significant digits gives 1230.0 for 1234.5 and 0.00123 for 0.0012345.
+    """
+    if decimals is not None and significant_digits is not None:
+        raise ValueError("Use either decimals or significant_digits, not both")
+    if decimals is not None:
+        return np.round(values, decimals)
+    if significant_digits is None:
+        return values
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        digits = significant_digits - 1 - np.floor(np.log10(np.abs(values)))
+    # Round the values with the same magnitude together, 0, NaN and inf are left as they are.
+    rounded = values.copy()
+    for d in np.unique(digits[np.isfinite(digits)]):
+        mask = digits == d
+        rounded[mask] = np.round(values[mask], int(d))
+    return rounded
+
+
+def format_event_template(index: pd.DatetimeIndex, indent: int = 2) -> np.ndarray:
+    """Byte rows with the indent and the start of every event line up to the value, <event date=".." time="..".
+    The template only depends on the index, so series on the same time axis can share it, see EventTemplates.
+    """
+    dates, times = format_event_datetimes(index)
+    return byte_matrix([f'{TAB * indent}<event date="'.encode(), dates, b'" time="', times, b'"'], n=len(index))
+
+
+class EventTemplates:
+    """Cache of event templates (see format_event_template), formatted once per distinct index.
+
+    The columns of a df (see XmlFile.from_df) and the series of an export often share their
+    time axis, their events only differ in the values. An index is matched on its length,
+    first and last datetime and then compared in full. The least recently used templates
+    are dropped when the cache holds more than max_bytes.
+    """
+
+    def __init__(self, indent: int = 2, max_bytes: int = 64 * 2**20):
+        self.indent = indent
+        self.max_bytes = max_bytes
+        self._templates = {}  # (len, first, last) -> list of (ns, template), in order of use
+        self._nbytes = 0
+
+    def get(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """Template of the index, from the cache when an equal index was formatted before"""
+        if len(index) == 0:
+            return format_event_template(index, indent=self.indent)
+        ns = index.as_unit("ns").asi8
+        key = (len(ns), ns[0], ns[-1])
+        for cached in self._templates.get(key, []):
+            if np.array_equal(cached[0], ns):
+                # Move to the end, the first key is the least recently used.
+                self._templates[key] = self._templates.pop(key)
+                return cached[1]
+
+        template = format_event_template(index, indent=self.indent)
+        self._templates[key] = self._templates.pop(key, []) + [(ns, template)]
+        self._nbytes += ns.nbytes + template.nbytes
+        while self._nbytes > self.max_bytes and len(self._templates) > 1:
+            for old_ns, old_template in self._templates.pop(next(iter(self._templates))):
+                self._nbytes -= old_ns.nbytes + old_template.nbytes
+        return template
+
+
+def format_event_values(
+    values: np.ndarray, miss_val: float = None, decimals: int = None, significant_digits: int = None
+) -> np.ndarray:
+    """Format values as byte rows, in the shortest repr of their dtype like str() (b'-4.807').
+    Every distinct value is formatted once.
+
+    miss_val (float, str): NaN is written as miss_val, the same as the <missVal> of the header (see format_miss_val)
+    decimals, significant_digits (int): round float values first, see round_values. The
+        shortest repr leaves out trailing zeros (1.5 and not 1.50).
+    """
+    values = np.asarray(values)
+    if values.dtype.kind != "f":
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        return byte_rows(uniques.astype(bytes))[codes]
+
+    # Factorize the bits, so -0.0 and 0.0 stay distinct.
+    codes, uniques = pd.factorize(values.view(f"u{values.dtype.itemsize}"))
+    uniques = round_values(uniques.view(values.dtype), decimals=decimals, significant_digits=significant_digits)
+    strings = uniques.astype(bytes)
+    strings = np.where(np.isnan(uniques), format_miss_val(miss_val).encode(), strings)
+    return byte_rows(strings)[codes]
+
+
+def format_event_attributes(column: str, values) -> np.ndarray:
+    """Format an optional event column (see EVENT_ATTRIBUTES) as xml attribute per event, e.g. b' flag="0"'.
+    Returns byte rows (utf-8), missing values give an empty row so the attribute is left out.
+    """
+    attribute = {v: k for k, v in EVENT_ATTRIBUTES.items()}[column]
+    categorical = pd.Categorical(values)
+    # Format every category once, code -1 (missing) takes the last item.
+    categories = [f" {attribute}={quoteattr(str(c))}".encode() for c in categorical.categories] + [b""]
+    return byte_rows(np.array(categories, dtype=bytes))[categorical.codes]
+
+
+def format_events(
+    index: pd.DatetimeIndex,
+    values: np.ndarray,
+    attributes: list = (),
+    indent: int = 2,
+    miss_val: float = None,
+    decimals: int = None,
+    significant_digits: int = None,
+    template: np.ndarray = None,
+) -> bytes:
+    """Format events as utf-8 xml lines, with vectorised string operations instead of a format per event.
+
+    index (pd.DatetimeIndex): naive datetimes in the PI timeZone that is written
+    values (np.ndarray): event values, None leaves the value out (binary series, the values are in the .bin)
+    attributes (list): byte rows of optional attributes, see format_event_attributes
+    miss_val, decimals, significant_digits: NaN and precision of the values, see format_event_values
+    template (np.ndarray): the date and time of the index that are already formatted, see EventTemplates
+
+    example:
+    <event date="2021-06-22" time="06:00:00" value="-4.8"/>
+    <event date="2021-06-22" time="06:15:00" value="-4.81" flag="0"/>
+    """
+    if template is None:
+        template = format_event_template(index, indent=indent)
+    columns = [template]
+    if values is not None:
+        values = format_event_values(
+            values, miss_val=miss_val, decimals=decimals, significant_digits=significant_digits
+        )
+        columns += [b' value="', values, b'"']
+    columns += [*attributes, b"/>\n"]
+    return join_byte_columns(columns, n=len(index))
+
+
 @dataclass
 class XmlDate:
     """Date representation of xml start or end date.
@@ -55,6 +475,13 @@ class XmlDate:
         time = data.get("time", "00:00:00")
         return XmlDate(key=key, date=date, time=time)
 
+    @classmethod
+    def from_datetime(cls, key, date_time: datetime.datetime):
+        """Create from datetime, key (e.g. 'start_date') is converted to camelCase."""
+        return XmlDate(
+            key=snake_to_camel_case(key), date=date_time.strftime("%Y-%m-%d"), time=date_time.strftime("%H:%M:%S")
+        )
+
     @property
     def date_time(self) -> datetime.datetime:
         # TODO date_time returns Timestamp not datetime.
@@ -68,12 +495,139 @@ class XmlDate:
         return str(self.date_time)
 
 
+@dataclass(frozen=True)
+class XmlTimeStep:
+    """Timestep of a series, the PI <timeStep> element.
+
+    unit (str): second, minute, hour, day, week, month, year or nonequidistant
+    multiplier (int): number of units per timestep
+    divider (int): the timestep is multiplier units / divider
+
+    Indexes and number of timesteps are computed with integer arithmetic, calendar
+    units (month, year) step through months.
+    """
+
+    unit: str
+    multiplier: int = 1
+    divider: int = 1
+
+    def __post_init__(self):
+        if self.unit not in TIME_STEP_SECONDS and self.unit not in TIME_STEP_MONTHS and self.unit != "nonequidistant":
+            raise NotImplementedError(f"Timestep unit [{self.unit}]")
+        if self.unit in TIME_STEP_MONTHS and self.divider != 1:
+            raise NotImplementedError(f"Timestep divider with unit [{self.unit}]")
+
+    @classmethod
+    def from_pi_header(cls, data: dict):
+        """Convert FEWS timestep dict to object
+
+        data (dict): fews timestep attributes (e.g. {'unit': 'second', 'multiplier': '900'})
+        """
+        return cls(unit=data["unit"], multiplier=int(data.get("multiplier", 1)), divider=int(data.get("divider", 1)))
+
+    @classmethod
+    def from_timedelta(cls, timedelta: pd.Timedelta):
+        """Timestep of an equidistant index, in the largest unit that fits exactly."""
+        seconds, remainder = divmod(pd.Timedelta(timedelta).value, 10**9)
+        if remainder != 0 or seconds <= 0:
+            raise ValueError(f"Timestep should be a positive number of seconds, got {timedelta}")
+        for unit in ["week", "day", "hour", "minute", "second"]:
+            if seconds % TIME_STEP_SECONDS[unit] == 0:
+                return cls(unit=unit, multiplier=seconds // TIME_STEP_SECONDS[unit])
+
+    @classmethod
+    def from_index(cls, index: pd.DatetimeIndex):
+        """Timestep of an index, nonequidistant when the steps differ or are not a positive number of seconds."""
+        steps = np.diff(index.as_unit("ns").asi8)
+        if len(steps) == 0 or (steps != steps[0]).any() or steps[0] <= 0 or steps[0] % 10**9 != 0:
+            return cls(unit="nonequidistant")
+        return cls.from_timedelta(pd.Timedelta(int(steps[0]), unit="ns"))
+
+    @property
+    def is_equidistant(self) -> bool:
+        return self.unit != "nonequidistant"
+
+    @property
+    def is_calendar(self) -> bool:
+        """Month and year steps differ in duration"""
+        return self.unit in TIME_STEP_MONTHS
+
+    @property
+    def nanoseconds(self) -> int:
+        """Duration of a timestep of a fixed unit in ns"""
+        if not self.is_equidistant or self.is_calendar:
+            raise ValueError(f"Timestep with unit [{self.unit}] has no fixed duration")
+        step, remainder = divmod(TIME_STEP_SECONDS[self.unit] * self.multiplier * 10**9, self.divider)
+        if remainder != 0:
+            raise ValueError(f"Timestep {self} is not a whole number of nanoseconds")
+        return step
+
+    def _months(self, date_time: pd.Timestamp) -> int:
+        """Months since epoch, for calendar steps"""
+        return (date_time.year - 1970) * 12 + date_time.month - 1
+
+    def count(self, start: datetime.datetime, end: datetime.datetime) -> int:
+        """Count the timesteps from start up to and including end"""
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if self.is_calendar:
+            months = self.multiplier * TIME_STEP_MONTHS[self.unit]
+            count = (self._months(end) - self._months(start)) // months + 1
+            # The last step is after end when it falls later in its month (e.g. the 31st and end on the 30th).
+            if count > 0 and start + pd.DateOffset(months=(count - 1) * months) > end:
+                count -= 1
+            return count
+        return (end.value - start.value) // self.nanoseconds + 1
+
+    def index(self, start: datetime.datetime, end: datetime.datetime, positions: slice = None) -> pd.DatetimeIndex:
+        """All timesteps from start up to and including end, or only the timesteps at positions"""
+        start = pd.Timestamp(start)
+        steps = np.arange(*(positions or slice(None)).indices(self.count(start, end)), dtype=np.int64)
+        if self.is_calendar:
+            # Same day and time in every month as in the start month, clipped to the last
+            # day of shorter months like pd.DateOffset(months=n) (31 january, 28 february).
+            months = (self._months(start) + steps * (self.multiplier * TIME_STEP_MONTHS[self.unit])).astype(
+                "datetime64[M]"
+            )
+            days_in_month = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(np.int64)
+            days = (np.minimum(start.day, days_in_month) - 1).astype("timedelta64[D]")
+            dates = months.astype("datetime64[D]") + days
+            return pd.DatetimeIndex(dates.astype("datetime64[ns]")) + (start - start.normalize())
+        return pd.DatetimeIndex((start.value + steps * self.nanoseconds).view("datetime64[ns]"))
+
+    def window(self, start: datetime.datetime, end: datetime.datetime, window_start=None, window_end=None) -> slice:
+        """Positions of the timesteps between start and end that are within the window"""
+        if self.is_calendar:
+            index = self.index(start, end)
+            i_start = 0 if window_start is None else index.searchsorted(pd.Timestamp(window_start), side="left")
+            i_end = len(index) if window_end is None else index.searchsorted(pd.Timestamp(window_end), side="right")
+        else:
+            start = pd.Timestamp(start).value
+            count = self.count(start, end)
+            i_start = 0 if window_start is None else -(-(pd.Timestamp(window_start).value - start) // self.nanoseconds)
+            i_end = count if window_end is None else (pd.Timestamp(window_end).value - start) // self.nanoseconds + 1
+            i_start, i_end = min(max(i_start, 0), count), min(max(i_end, 0), count)
+        return slice(i_start, max(i_start, i_end))
+
+    def xml_str(self) -> str:
+        divider = "" if self.divider == 1 else f' divider="{self.divider}"'
+        if not self.is_equidistant:
+            return f"""<timeStep unit="{self.unit}"/>"""
+        return f"""<timeStep unit="{self.unit}" multiplier="{self.multiplier}"{divider}/>"""
+
+    def __str__(self):
+        """Short representation, used in XmlHeader.id"""
+        if not self.is_equidistant:
+            return self.unit
+        divider = "" if self.divider == 1 else f"/{self.divider}"
+        return f"{self.multiplier}{self.unit}{divider}"
+
+
 @dataclass
 class XmlHeader:
     """FEWS-PI header-style dataclass"""
 
     parameter_id: str = None
-    time_step: dict = None
+    time_step: XmlTimeStep = None
     miss_val: Union[int, float] = None
     units: str = None
     start_date: XmlDate = None
@@ -88,44 +642,35 @@ class XmlHeader:
     station_name: str = None
     z: float = None
     qualifier_ids: list[str] = None
+    time_zone: float = 0.0  # PI timeZone of the document, start_date and end_date are in this zone. None is unknown.
+
+    def __post_init__(self):
+        if isinstance(self.time_step, dict):
+            self.time_step = XmlTimeStep.from_pi_header(self.time_step)
 
     @classmethod
-    def from_pi_header_element(cls, subchild: objectify.ObjectifiedElement):
+    def from_pi_header_element(cls, subchild: etree._Element, time_zone: float = 0.0):
         """Parse Header from FEWS PI header dict.
         see: https://github.com/hdsr-mid/hdsr_fewspy/blob/main/hdsr_fewspy/converters/json_to_df_time_series.py
         Args:
-            subchild (objectify.ObjectifiedElement): Header element read  with lxml
+            subchild (etree._Element): Header element read with lxml
+            time_zone (float): PI timeZone of the document
         Returns:
             Header: FEWS-PI header-style dataclass
         """
 
-        # Create metadata dict from element
-        header_childs = subchild.getchildren()
+        # Table lookup per child, see HEADER_TAGS for the conversion of every tag.
         metadata = {}
-        for item in header_childs:
-            key = item.tag.split("}")[-1]
-
-            # if value of key is a dict, these are the keys. e.g.['date', 'time']
-            item_keys = item.keys()
-            if len(item_keys) == 0:
-                metadata[key] = item.text
+        for item in subchild:
+            tag_conversion = HEADER_TAGS.get(item.tag)
+            if tag_conversion is None:
+                continue  # tags that are not part of XmlHeader, or comments
+            key, convert = tag_conversion
+            if key == "qualifier_ids":  # can occur multiple times
+                metadata.setdefault(key, []).append(convert(item))
             else:
-                metadata[key] = {}
-                for item_key, item_value in zip(item_keys, item.values()):
-                    metadata[key][item_key] = item_value
-
-        # transform dict to input for XmlHeader
-        def _convert_kv(key: str, value):
-            key = camel_to_snake_case(key)
-            if key in DATETIME_KEYS:
-                value = XmlDate.from_pi_header(key, value)
-            if key in FLOAT_KEYS:
-                value = float(value)
-            return key, value
-
-        args = (_convert_kv(k, v) for k, v in metadata.items())
-        header = XmlHeader(**{i[0]: i[1] for i in args if i[0] in cls.__dataclass_fields__.keys()})
-        return header
+                metadata[key] = convert(item)
+        return cls(**metadata, time_zone=time_zone)
 
     @property
     def id(self):
@@ -140,12 +685,25 @@ class XmlHeader:
     @property
     def _time_step_str(self):
         """Str representation of timestep for self.id"""
-        return f"{self.time_step['multiplier']}{self.time_step['unit']}"
+        return str(self.time_step)
+
+    @property
+    def is_equidistant(self) -> bool:
+        """Header with an equidistant timestep, a header without <timeStep> is treated as nonequidistant"""
+        return self.time_step is not None and self.time_step.is_equidistant
 
-    def to_str(self, indent: int = 2):
+    @property
+    def timesteps(self) -> int:
+        """Number of timesteps between start and end date, None for nonequidistant series"""
+        if not self.is_equidistant:
+            return None
+        return self.time_step.count(self.start_date.date_time, self.end_date.date_time)
+
+    def to_str(self, indent: int = 2, dates: bool = False):
         """Str representation of header
 
         indent (int): indentation for writing to file
+        dates (bool): write startDate and endDate, these are required in a binary file
         """
 
         return_str = f"""{TAB*indent}<header>
@@ -170,14 +728,23 @@ class XmlHeader:
             return_str = "\n".join(
                 [
                     return_str,
-                    f"""{TAB*(indent+1)}<timeStep unit="{self.time_step['unit']}" multiplier="{self.time_step['multiplier']}"/>""",
+                    f"""{TAB*(indent+1)}{self.time_step.xml_str()}""",
+                ]
+            )
+
+        if dates and self.start_date is not None:
+            return_str = "\n".join(
+                [
+                    return_str,
+                    f"""{TAB*(indent+1)}{self.start_date.xml_str}""",
+                    f"""{TAB*(indent+1)}{self.end_date.xml_str}""",
                 ]
             )
 
         return_str = "\n".join(
             [
                 return_str,
-                f"""{TAB*(indent+1)}<missVal>{self.miss_val}</missVal>
+                f"""{TAB*(indent+1)}<missVal>{format_miss_val(self.miss_val)}</missVal>
 {TAB*indent}</header>""",
             ]
         )
@@ -187,6 +754,110 @@ class XmlHeader:
         return self.to_str(indent=0)
 
 
+_TIME_STEPS = {}
+
+
+def _convert_text(item: etree._Element) -> str:
+    """Element text, interned so repeated values (ids, units) share one str."""
+    return None if item.text is None else sys.intern(item.text)
+
+
+def _convert_float(item: etree._Element) -> float:
+    return float(item.text)
+
+
+def _convert_time_step(item: etree._Element) -> XmlTimeStep:
+    """Timestep, the same (frozen) XmlTimeStep is shared by all series with this timestep."""
+    key = tuple(item.items())
+    time_step = _TIME_STEPS.get(key)
+    if time_step is None:
+        time_step = _TIME_STEPS[key] = XmlTimeStep.from_pi_header(dict(key))
+    return time_step
+
+
+def _date_converter(key: str):
+    def _convert_date(item: etree._Element) -> XmlDate:
+        return XmlDate(
+            key=key, date=sys.intern(item.get("date", "2000-01-01")), time=sys.intern(item.get("time", "00:00:00"))
+        )
+
+    return _convert_date
+
+
+def _header_tags() -> dict:
+    """Conversion table for the children of a PI <header>.
+    Maps the tag, with and without namespace, to (XmlHeader field, converter).
+    """
+    header_tags = {}
+    for field in XmlHeader.__dataclass_fields__:
+        tag = snake_to_camel_case(field)
+        convert = _convert_text
+        if field in DATETIME_KEYS:
+            convert = _date_converter(tag)
+        elif field in FLOAT_KEYS:
+            convert = _convert_float
+        elif field == "time_step":
+            convert = _convert_time_step
+        elif field == "qualifier_ids":
+            tag = "qualifierId"
+
+        header_tags[tag] = (field, convert)
+        header_tags[f"{{{PI_NAMESPACE}}}{tag}"] = (field, convert)
+    return header_tags
+
+
+HEADER_TAGS = _header_tags()
+
+
+@dataclass
+class XmlFilter:
+    """Selection of series and time window, applied while an xml is read.
+
+    location_ids, parameter_ids (str, list): select series with one of these ids
+    qualifier_ids (str, list): select series that have at least one of these qualifiers
+    start, end (datetime, str): only keep the events in this time window
+    """
+
+    location_ids: list[str] = None
+    parameter_ids: list[str] = None
+    qualifier_ids: list[str] = None
+    start: pd.Timestamp = None
+    end: pd.Timestamp = None
+
+    def __post_init__(self):
+        for key in ["location_ids", "parameter_ids", "qualifier_ids"]:
+            if isinstance(getattr(self, key), str):
+                setattr(self, key, [getattr(self, key)])
+        for key in ["start", "end"]:
+            if getattr(self, key) is not None:
+                setattr(self, key, pd.Timestamp(getattr(self, key)))
+
+    @property
+    def has_time_window(self) -> bool:
+        return self.start is not None or self.end is not None
+
+    def in_time_zone(self, time_zone: float):
+        """Filter with the time window as naive datetimes in the PI timeZone of a document.
+        A naive start or end is taken as already being in that time zone.
+        """
+        window = {}
+        for key in ["start", "end"]:
+            date_time = getattr(self, key)
+            if date_time is not None and date_time.tz is not None:
+                window[key] = date_time.tz_convert(pi_time_zone(time_zone)).tz_localize(None)
+        return replace(self, **window) if window else self
+
+    def select_header(self, header: XmlHeader) -> bool:
+        """Check if series with this header should be read"""
+        if self.location_ids is not None and header.location_id not in self.location_ids:
+            return False
+        if self.parameter_ids is not None and header.parameter_id not in self.parameter_ids:
+            return False
+        if self.qualifier_ids is not None and not set(header.qualifier_ids or []).intersection(self.qualifier_ids):
+            return False
+        return True
+
+
 class XmlTimeSeries:
     """
     Unique timeserie in an xml.
@@ -201,30 +872,91 @@ class XmlTimeSeries:
                         <parameterId>h.streef.boven</parameterId>
                         <missVal>-9999</missVal>
                 </header>
-        <event date="2023-01-02" time="00:00:00" value="nan"/>
+        <event date="2023-01-02" time="00:00:00" value="-9999"/>
         <event date="2023-01-02" time="00:15:00" value="4"/>
 
     </series>
     """
 
-    def __init__(self, header: XmlHeader, data: np.array = None, is_binary=False):
+    def __init__(
+        self,
+        header: XmlHeader,
+        data: np.array = None,
+        is_binary=False,
+        index: pd.DatetimeIndex = None,
+        event_columns: dict = None,
+        tz="UTC",
+    ):
         self.header = header
-        self.data = data
+        self._data = data
         self.is_binary = is_binary
+        self.index = index  # Event datetimes of non-binary series
+        self.event_columns = event_columns  # Optional event attributes of non-binary series, see read_events
+        self.tz = tz  # Time zone of the df index, None keeps the naive datetimes of the document
 
-        self._events = None
-
-        self._eventstr_base = None
         self._df = None
+        self._store = None  # (SeriesStore, id) when the serie is a view on a store, see SeriesStore.__getitem__
 
     @classmethod
     def from_df(cls, header: XmlHeader, df_serie: pd.Series):
-        ts = XmlTimeSeries(header=header)
-        # set dataframe.
-        df_ts = pd.DataFrame(df_serie)
-        df_ts.columns = ["value"]
-        ts.df = df_ts
-        return ts
+        """Create XmlTimeSeries from a pd.Series with datetime index.
+        A tz-aware index is stored in the PI timeZone of the header, a naive index as it is.
+        The time zone of a naive index is unknown (header.time_zone None), it is written as it is.
+        """
+        index = pd.DatetimeIndex(df_serie.index).as_unit("ns")
+        if index.tz is None:
+            header = replace(header, time_zone=None)
+        return cls(
+            header=header,
+            data=df_serie.to_numpy(),
+            index=delocalize_index(index, header.time_zone),
+            tz=index.tz,
+        )
+
+    @classmethod
+    def from_pi_series_element(
+        cls,
+        series_element: etree._Element,
+        header: XmlHeader = None,
+        is_binary=False,
+        xml_filter: XmlFilter = None,
+        time_zone: float = 0.0,
+        tz="UTC",
+        dtype=None,
+    ):
+        """Create XmlTimeSeries from a <series> element.
+        Events are read for non-binary series. The values of binary series
+        are not in the xml, these are set from the .bin by the reader.
+
+        header (XmlHeader): already parsed header of the series, parsed from the element when None
+        xml_filter (XmlFilter): only events within xml_filter.start and xml_filter.end are read,
+            these are naive datetimes in time_zone (see XmlFilter.in_time_zone)
+        time_zone (float): PI timeZone of the document, used when the header is parsed
+        tz (str, tzinfo): time zone of the df index, see XmlTimeSeries.timeseries_index
+        dtype (np.dtype): dtype of the event values, float64 when None
+        """
+        if header is None:
+            for subchild in series_element:
+                if subchild.tag.endswith("header"):  # gewoonlijk eerste subchild is de header
+                    header = XmlHeader.from_pi_header_element(subchild, time_zone=time_zone)
+                    break
+
+        if header is None:
+            raise ValueError("Header should not be None at this point")
+
+        serie = cls(header=header, is_binary=is_binary, tz=tz)
+        if is_binary and not header.is_equidistant:
+            # Values are in the bin, the dates of a nonequidistant serie only in the events.
+            serie.index = read_event_dates(series_element)
+        elif not is_binary:
+            dtype = np.float64 if dtype is None else dtype
+            if xml_filter is None:
+                serie.index, serie.data, serie.event_columns = read_events(series_element, dtype=dtype)
+            else:
+                serie.index, serie.data, serie.event_columns = read_events(
+                    series_element, start=xml_filter.start, end=xml_filter.end, dtype=dtype
+                )
+        return serie
 
     @property
     def id(self):
@@ -233,112 +965,851 @@ class XmlTimeSeries:
 
     @property
     def start(self) -> datetime.datetime:
-        """Start datetime"""
+        """Start datetime, in the PI timeZone of the document"""
         return self.header.start_date.date_time
 
     @property
     def end(self) -> datetime.datetime:
-        """End datetime"""
+        """End datetime, in the PI timeZone of the document"""
         return self.header.end_date.date_time
 
     @property
     def timesteps(self) -> int:
         """Number of timesteps in series"""
-        # TODO what to do with nonequi?
-        if self.header.time_step["unit"] == "second":
-            unit_factor = 1  # seconds dont need adjustment
-        elif self.header.time_step["unit"] == "minute":
-            unit_factor = 60
-        elif self.header.time_step["unit"] == "hour":
-            unit_factor = 3600
+        if not self.header.is_equidistant:
+            return len(self.index)
+        return self.header.timesteps
+
+    def slice_time(self, start: pd.Timestamp = None, end: pd.Timestamp = None):
+        """Limit a binary serie to the timesteps within start and end.
+        The offsets follow from the header, data stays a view and the header dates are updated.
+        """
+        if not self.header.is_equidistant:
+            window = slice(*self.index.slice_indexer(start, end).indices(len(self.index))[:2])
+            index = self.index = self.index[window]
         else:
-            raise NotImplementedError(f"Timestep unit [{self.header.time_step['unit']}]")
-        return int(
-            (self.end - self.start).total_seconds() / unit_factor / int(self.header.time_step["multiplier"]) + 1
+            window = self.header.time_step.window(self.start, self.end, window_start=start, window_end=end)
+            index = self.local_index[window]
+
+        self._data = self._data[window]
+        if len(index) > 0:
+            self.header.start_date = XmlDate.from_datetime("start_date", index[0])
+            self.header.end_date = XmlDate.from_datetime("end_date", index[-1])
+        self._df = None
+        self._write_through()
+
+    def part(self, positions: slice):
+        """Create a serie with the timesteps at positions, the data stays a view and the header dates are updated."""
+        start, stop, _ = positions.indices(len(self.data))
+        event_columns = None
+        if self.event_columns is not None:
+            event_columns = {k: v[start:stop] for k, v in self.event_columns.items()}
+        header = self.header
+        if stop > start:
+            header = replace(
+                header,
+                start_date=XmlDate.from_datetime("start_date", self.local_index_at(slice(start, start + 1))[0]),
+                end_date=XmlDate.from_datetime("end_date", self.local_index_at(slice(stop - 1, stop))[0]),
+            )
+        return XmlTimeSeries(
+            header=header,
+            data=self.data[start:stop],
+            is_binary=self.is_binary,
+            index=None if self.index is None else self.index[start:stop],
+            event_columns=event_columns,
+            tz=self.tz,
         )
 
+    def bytes_per_event(
+        self,
+        binary: bool = False,
+        time_zone: float = 0.0,
+        sample_size: int = 100,
+        decimals: int = None,
+        significant_digits: int = None,
+    ) -> float:
+        """Estimate of the bytes an event takes in a written file, from the first sample_size events.
+        Binary files take 4 bytes per value in the .bin and an <event> without value for nonequidistant series.
+        """
+        sample = self.part(slice(0, sample_size))
+        if len(sample.data) == 0:
+            return 0.0
+        if not binary:
+            events = sample.iter_events(time_zone, decimals=decimals, significant_digits=significant_digits)
+            return len(b"".join(events)) / len(sample.data)
+        if self.binary_time_step().is_equidistant:
+            return 4.0
+        return 4 + len(format_events(sample.written_index_at(slice(None), time_zone), values=None)) / len(sample.data)
+
     @property
-    def timeseries_index(self) -> pd.DatetimeIndex:
-        """Index column of all timesteps"""
-        return pd.date_range(start=self.start, end=self.end, periods=self.timesteps)
+    def local_index(self) -> pd.DatetimeIndex:
+        """Naive datetimes of all timesteps, in the PI timeZone of the document"""
+        return self.local_index_at()
 
-    @staticmethod
-    def _make_eventstr_base(pd_timeindex_serie, indent=2):
-        """Create base event string with date and time and empty value
-        the value can be added later with string formatting
+    def local_index_at(self, positions: slice = None) -> pd.DatetimeIndex:
+        """Naive datetimes of the timesteps at positions (all when None), in the PI timeZone of the document.
+        The index of a binary equidistant serie is only computed for these positions.
         """
-        return f'{TAB*indent}<event date="{pd_timeindex_serie.strftime(f"%Y-%m-%d")}" \
-time="{pd_timeindex_serie.strftime(f"%H:%M:%S")}" \
-value="{"{}"}"/>\n'
+        if not self.is_binary or not self.header.is_equidistant:
+            return self.index if positions is None else self.index[positions]
+        return self.header.time_step.index(start=self.start, end=self.end, positions=positions)
 
     @property
-    def eventstr_base(self):
-        """Create string with every event on a new line.
+    def timeseries_index(self) -> pd.DatetimeIndex:
+        """Index column of all timesteps, tz-aware in self.tz"""
+        return localize_index(self.local_index, time_zone=self.header.time_zone, tz=self.tz)
+
+    def written_index_at(self, positions: slice, time_zone: float = 0.0) -> pd.DatetimeIndex:
+        """Naive datetimes of the timesteps at positions in the PI timeZone that is written.
+        Series are shifted from the PI timeZone of their header, also when they were read with a
+        naive index (tz=None). Only series with an unknown time zone (header.time_zone None, e.g.
+        from a naive df) are written as they are.
+        """
+        index = self.local_index_at(positions)
+        if self.header.time_zone is None:
+            return index
+        return delocalize_index(localize_index(index, time_zone=self.header.time_zone), time_zone)
+
+    def make_eventstr_base(self, time_zone: float = 0.0) -> str:
+        """Create string with every event on a new line, with the datetimes in the PI timeZone that is written.
         This string still needs to be formatted with the values.
 
         example:
         <event date="2021-06-22" time="06:00:00" value="{}"/>
         <event date="2021-06-22" time="06:15:00" value="{}"/>
         """
-        # TODO get rid of apply
-        if self._eventstr_base is None:
-            self._eventstr_base = "".join(
-                pd.Series(self.df.index).apply(lambda x: self._make_eventstr_base(x, indent=2))
-            )
-        return self._eventstr_base
+        template = format_event_template(self.written_index_at(slice(None), time_zone))
+        placeholders = b"{}" * len(self.event_attribute_columns)
+        return join_byte_columns([template, b' value="{}"' + placeholders + b"/>\n"], n=len(template)).decode()
 
-    @eventstr_base.setter
-    def eventstr_base(self, eventstr_base):
-        self._eventstr_base = eventstr_base
+    @property
+    def eventstr_base(self):
+        """Event string in the PI timeZone 0.0 (UTC), see make_eventstr_base"""
+        return self.make_eventstr_base()
 
     @property
     def events(self):
-        """Str representation of events filled with values
+        """Events in the PI timeZone 0.0 (UTC), see make_events"""
+        return self.make_events()
+
+    def make_events(self, time_zone: float = 0.0) -> str:
+        """Str representation of events filled with values, see iter_events
 
         example:
         <event date="2021-06-22" time="06:00:00" value="-4.80"/>
-        <event date="2021-06-22" time="06:15:00" value="-4.81"/>
+        <event date="2021-06-22" time="06:15:00" value="-4.81" flag="0"/>
         """
-        if self._events is None:
-            self._events = self.eventstr_base.format(*self.df["value"].to_numpy())
-        return self._events
+        return b"".join(self.iter_events(time_zone)).decode()
 
-    def to_str(self):
+    def iter_events(
+        self,
+        time_zone: float = 0.0,
+        chunk_size: int = EVENT_CHUNK_SIZE,
+        decimals: int = None,
+        significant_digits: int = None,
+        templates: EventTemplates = None,
+    ):
+        """Yield the events as utf-8 xml lines, chunk_size events at a time (see format_events).
+        Nothing is cached on the serie, so memory is bounded by the chunk and not by the serie.
+        NaN is written as the missVal of the header, decimals and significant_digits round the values.
+        templates (EventTemplates): share the formatted dates and times with series on the same index
+        """
+        columns = self.event_attribute_columns
+        for chunk_start in range(0, len(self.data), chunk_size):
+            positions = slice(chunk_start, chunk_start + chunk_size)
+            attributes = [format_event_attributes(c, self.event_columns[c][positions]) for c in columns]
+            index = self.written_index_at(positions, time_zone)
+            yield format_events(
+                index,
+                self.data[positions],
+                attributes=attributes,
+                miss_val=self.header.miss_val,
+                decimals=decimals,
+                significant_digits=significant_digits,
+                template=templates.get(index) if templates is not None else None,
+            )
+
+    def iter_xml(
+        self,
+        time_zone: float = 0.0,
+        chunk_size: int = EVENT_CHUNK_SIZE,
+        binary: bool = False,
+        decimals: int = None,
+        significant_digits: int = None,
+        templates: EventTemplates = None,
+    ):
+        """Yield the <series> element as utf-8 bytes, the events in chunks, see iter_events
+
+        binary (bool): write the header for a binary file, the values go to the .bin (see write_bin).
+            Only nonequidistant series get events, with the date and time.
+        decimals, significant_digits (int): precision of the event values, not used for binary files
+        """
+        if not binary:
+            yield f"\t<series>\n{self.header.to_str(indent=2)}\n".encode()
+            yield from self.iter_events(
+                time_zone,
+                chunk_size=chunk_size,
+                decimals=decimals,
+                significant_digits=significant_digits,
+                templates=templates,
+            )
+            yield b"\t</series>"
+            return
+
+        header = self.binary_header(time_zone)
+        yield f"\t<series>\n{header.to_str(indent=2, dates=True)}\n".encode()
+        if not header.time_step.is_equidistant:
+            for chunk_start in range(0, len(self.data), chunk_size):
+                positions = slice(chunk_start, chunk_start + chunk_size)
+                index = self.written_index_at(positions, time_zone)
+                yield format_events(
+                    index, values=None, template=templates.get(index) if templates is not None else None
+                )
+        yield b"\t</series>"
+
+    def binary_time_step(self) -> XmlTimeStep:
+        """Timestep of the serie in a binary file.
+
+        The timestep of the header when the values cover all of its timesteps, otherwise it is
+        detected from the index (e.g. a non-binary serie with gaps is written nonequidistant).
+        """
+        time_step = self.header.time_step
+        if self.is_binary and self.header.is_equidistant:
+            if len(self.data) != self.header.timesteps:
+                raise ValueError(f"{self.id} has {len(self.data)} values, its header {self.header.timesteps}")
+            return time_step
+
+        index = self.local_index
+        if self.header.is_equidistant and len(index) > 0:
+            if time_step.index(index[0], index[-1]).equals(index):
+                return time_step
+        return XmlTimeStep.from_index(index)
+
+    def binary_header(self, time_zone: float = 0.0) -> XmlHeader:
+        """Header of the serie in a binary file, with the timestep (see binary_time_step) and
+        the start and end date in the PI timeZone that is written.
+        """
+        if len(self.data) == 0:
+            return replace(self.header, time_step=XmlTimeStep(unit="nonequidistant"), start_date=None, end_date=None)
+        first = self.written_index_at(slice(0, 1), time_zone)[0]
+        last = self.written_index_at(slice(len(self.data) - 1, None), time_zone)[0]
+        return replace(
+            self.header,
+            time_step=self.binary_time_step(),
+            start_date=XmlDate.from_datetime("start_date", first),
+            end_date=XmlDate.from_datetime("end_date", last),
+            time_zone=time_zone,
+        )
+
+    def write_bin(self, f):
+        """Write the values to a .bin file object as float32, NaN as missVal, see write_bin_values"""
+        write_bin_values(f, self.data, miss_val=self.header.miss_val)
+
+    @property
+    def event_attribute_columns(self) -> list:
+        """Optional event columns (see EVENT_ATTRIBUTES and read_events) that are written as attribute"""
+        return [c for c in EVENT_ATTRIBUTES.values() if c in (self.event_columns or {})]
+
+    def to_str(self, time_zone: float = 0.0):
         """Str representation of serie. Has headers and events
-        can be used for writing in a XmlFile
+
+        time_zone (float): PI timeZone of the file, tz-aware indexes are shifted to it
         """
-        return f"""\t<series>
-{self.header.to_str(indent=2)}
-{self.events}\t</series>"""
+        return b"".join(self.iter_xml(time_zone)).decode()
 
     def print(self):
         print(self.to_str())
 
+    @property
+    def data(self) -> np.ndarray:
+        """Event values. Assigning new values to a view on a store also replaces the serie in the store."""
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._df = None
+        self._write_through()
+
+    def _write_through(self):
+        """Store the serie again when it is a view on a store, so the store has the new data"""
+        if self._store is not None:
+            store, serie_id = self._store
+            store[serie_id] = self
+
     @property
     def df(self) -> pd.DataFrame:
         """Data to pd.DataFrame. The df has datetime index and one column 'value'"""
         if self._df is None:
             if self.is_binary:
-                df = pd.DataFrame(self.data, columns=["value"])
-                df.set_index(self.timeseries_index, inplace=True)
+                # No copy, the column stays a view on the (memory mapped) bin values.
+                df = pd.DataFrame({"value": np.asarray(self.data)}, index=self.timeseries_index, copy=False)
             else:
-                df = pd.DataFrame(self.data)
-                df.set_index(pd.to_datetime(df[0] + "T" + df[1]), inplace=True)
-                df.drop([0, 1], axis=1, inplace=True)
-                df.rename({2: "value"}, axis=1, inplace=True)
-                df["value"] = df["value"].astype(float)
+                columns = {"value": self.data, **(self.event_columns or {})}
+                df = pd.DataFrame(columns, index=self.timeseries_index, copy=False)
             self._df = df
         return self._df
 
     @df.setter
     def df(self, df):
+        """Replace the events with a df like .df, a datetime index, a 'value' column and optional event
+        columns (see EVENT_ATTRIBUTES). The serie is written from the new data, also a binary serie.
+        A serie of an XmlFile (xml_file.series[serie_id]) is also replaced in the file.
+        """
+        index = pd.DatetimeIndex(df.index).as_unit("ns")
+        if index.tz is not None and self.header.time_zone is None:
+            self.header = replace(self.header, time_zone=0.0)
+
+        self._data = df["value"].to_numpy()
+        self.index = delocalize_index(index, self.header.time_zone)
+        self.tz = index.tz
+        self.event_columns = {c: df[c].array for c in EVENT_ATTRIBUTES.values() if c in df.columns} or None
+        self.is_binary = False
+        self._write_through()
         self._df = df
 
 
+def stack_rows(rows: list) -> np.ndarray:
+    """Stack 1D arrays with equal length into a 2D array with a row per array.
+
+    Rows that follow each other in the same buffer, like consecutive series in a
+    memory mapped .bin, become one strided view on that buffer instead of a copy.
+    """
+    first = rows[0]
+
+    def owner(values):
+        while isinstance(values.base, np.ndarray):
+            values = values.base
+        return values
+
+    first_owner = owner(first)
+    pointers = np.array([row.__array_interface__["data"][0] for row in rows], dtype=np.int64)
+    if (
+        first.nbytes > 0
+        and all(row.dtype == first.dtype and row.flags.c_contiguous and owner(row) is first_owner for row in rows)
+        and (np.diff(pointers) == first.nbytes).all()
+    ):
+        return np.lib.stride_tricks.as_strided(
+            first, shape=(len(rows), len(first)), strides=(first.nbytes, first.itemsize), writeable=False
+        )
+    return np.stack(rows)
+
+
+class TimeBlock:
+    """Equidistant series that share a time axis, stored as one 2D array with a row per serie.
+
+    Rows are collected while reading and stacked into .data on first bulk use,
+    see stack_rows. The axis is the index of text series, or is derived from the
+    timestep, start and end of binary series.
+    """
+
+    def __init__(self, is_binary: bool, tz, time_zone: float, index: pd.DatetimeIndex = None, axis: tuple = None):
+        self.is_binary = is_binary
+        self.tz = tz
+        self.time_zone = time_zone
+        self._index = index
+        self._axis = axis  # (time_step, start, end) when there is no index
+
+        self.ids = []  # Serie id per row, rows of replaced series stay in the block
+        self._data = None
+        self._rows = []
+
+    @property
+    def local_index(self) -> pd.DatetimeIndex:
+        """Naive datetimes of the axis, in the PI timeZone of the document"""
+        if self._index is None:
+            time_step, start, end = self._axis
+            self._index = time_step.index(start=start, end=end)
+        return self._index
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        """Datetimes of the axis, tz-aware in self.tz"""
+        return localize_index(self.local_index, time_zone=self.time_zone, tz=self.tz)
+
+    @property
+    def data(self) -> np.ndarray:
+        """2D array with shape (rows, timesteps)"""
+        if self._rows:
+            rows = stack_rows(self._rows)
+            self._data = rows if self._data is None else np.concatenate([self._data, rows])
+            self._rows = []
+        return self._data
+
+    def append(self, serie_id: str, data: np.ndarray) -> int:
+        """Add the data of a serie, returns its row"""
+        self.ids.append(serie_id)
+        self._rows.append(data)
+        return len(self.ids) - 1
+
+    def row(self, row: int) -> np.ndarray:
+        """Return the data of a serie, a view on the block"""
+        n_stacked = 0 if self._data is None else len(self._data)
+        if row < n_stacked:
+            return self._data[row]
+        return self._rows[row - n_stacked]
+
+    def view(self, header: XmlHeader, row: int, event_columns: dict = None) -> XmlTimeSeries:
+        return XmlTimeSeries(
+            header=header,
+            data=self.row(row),
+            is_binary=self.is_binary,
+            index=None if self.is_binary else self._index,  # binary series derive it from their header
+            event_columns=event_columns,
+            tz=self.tz,
+        )
+
+
+class RaggedBlock:
+    """Series that each have their own (nonequidistant) time axis.
+
+    Data and index of all series are concatenated into two 1D arrays,
+    with the start of every serie in .offsets.
+    """
+
+    def __init__(self):
+        self.ids = []  # Serie id per row, rows of replaced series stay in the block
+        self.is_binary = []
+        self.tz = []
+        self.time_zone = []
+
+        self._data = None
+        self._index = None
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = []
+
+    def _stack(self):
+        if self._rows:
+            data = [self._data] if self._data is not None else []
+            index = [self._index] if self._index is not None else []
+            data += [serie_data for serie_data, _ in self._rows]
+            index += [serie_index for _, serie_index in self._rows]
+            offsets = self._offsets[-1] + bin_offsets([len(data) for data, _ in self._rows])
+            self._offsets = np.concatenate([self._offsets, offsets[1:]])
+            self._data = np.concatenate(data)
+            self._index = np.concatenate(index)
+            self._rows = []
+
+    @property
+    def data(self) -> np.ndarray:
+        """Values of all series, concatenated"""
+        self._stack()
+        return self._data
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """Start of every serie in data, with the total length as last item"""
+        self._stack()
+        return self._offsets
+
+    def append(self, serie_id: str, data: np.ndarray, index: pd.DatetimeIndex, is_binary: bool, tz, time_zone) -> int:
+        """Add the data and index of a serie, returns its row"""
+        self.ids.append(serie_id)
+        self.is_binary.append(is_binary)
+        self.tz.append(tz)
+        self.time_zone.append(time_zone)
+        self._rows.append((data, index.as_unit("ns").asi8))
+        return len(self.ids) - 1
+
+    def row(self, row: int) -> tuple:
+        """Return the data and naive index of a serie, views on the block"""
+        n_stacked = len(self._offsets) - 1
+        if row < n_stacked:
+            start, stop = self._offsets[row], self._offsets[row + 1]
+            data, index = self._data[start:stop], self._index[start:stop]
+        else:
+            data, index = self._rows[row - n_stacked]
+        return data, pd.DatetimeIndex(index.view("datetime64[ns]"))
+
+    def view(self, header: XmlHeader, row: int, event_columns: dict = None) -> XmlTimeSeries:
+        data, index = self.row(row)
+        return XmlTimeSeries(
+            header=header,
+            data=data,
+            is_binary=self.is_binary[row],
+            index=index,
+            event_columns=event_columns,
+            tz=self.tz[row],
+        )
+
+
+def header_row(header: XmlHeader) -> tuple:
+    """Values of a header for the catalogue, in the order of CATALOGUE_COLUMNS"""
+    return (
+        header.location_id,
+        header.parameter_id,
+        ",".join(header.qualifier_ids or []),
+        header.module_instance_id,
+        header.type,
+        None if header.time_step is None else str(header.time_step),
+        None if header.start_date is None else f"{header.start_date.date}T{header.start_date.time}",
+        None if header.end_date is None else f"{header.end_date.date}T{header.end_date.time}",
+        header.time_zone,
+        header.miss_val,
+        header.units,
+        header.station_name,
+        header.lat,
+        header.lon,
+        header.x,
+        header.y,
+        header.z,
+    )
+
+
+def header_rows_to_df(ids: list, rows: list) -> pd.DataFrame:
+    """Catalogue DataFrame from header_row tuples, with typed columns"""
+    columns = dict(zip(CATALOGUE_COLUMNS, zip(*rows))) if rows else dict.fromkeys(CATALOGUE_COLUMNS, ())
+    df = pd.DataFrame(index=pd.Index(ids, name="id", dtype=object))
+    for column, dtype in CATALOGUE_COLUMNS.items():
+        values = columns[column]
+        if dtype == "datetime":
+            df[column] = parse_event_datetimes(list(values))  # None is NaT
+        elif dtype == "float":
+            df[column] = np.array(values, dtype=np.float64)  # None is NaN
+        else:
+            df[column] = pd.Series(values, index=df.index, dtype=dtype)
+    return df
+
+
+class SeriesStore:
+    """The series of an XmlFile by id, in the order they were added.
+
+    Equidistant series that share a time axis are rows of one TimeBlock, other
+    series are stored in a RaggedBlock. Headers and optional event columns are
+    kept per serie. An XmlTimeSeries is created as a view on the blocks when a
+    serie is accessed, so bulk operations can work on the blocks directly.
+    Assigning df or data to a view replaces the serie in the store.
+    Blocks can be shared with a subset of the store, see subset.
+
+    The headers are also collected in a catalogue DataFrame, a row of the
+    catalogue is prepared when a serie is added.
+
+    Supports the pd.Series interface that XmlFile.series had: [id], in, len,
+    iteration over the series, .items(), .keys(), .index and .iloc.
+    """
+
+    def __init__(self):
+        self._series = {}  # id -> (header, block, row)
+        self._event_columns = {}
+        self._time_blocks = {}  # axis key -> list of TimeBlock
+        self._ragged_blocks = {}  # dtype -> RaggedBlock
+
+        self._header_rows = {}  # id -> header_row, for the catalogue
+        self._catalogue = None
+        self._catalogue_replaced = False  # a row of the cached catalogue changed
+
+    def _time_block(self, serie: XmlTimeSeries, data: np.ndarray):
+        """TimeBlock with the time axis of the serie, None when the serie is irregular."""
+        header = serie.header
+        if not header.is_equidistant:
+            return None
+
+        if serie.is_binary:
+            start, end = header.start_date.date_time, header.end_date.date_time
+            key = (data.dtype.str, True, serie.tz, header.time_zone, header.time_step, start, end)
+            blocks = self._time_blocks.setdefault(key, [])
+            if not blocks:
+                blocks.append(
+                    TimeBlock(
+                        is_binary=True, tz=serie.tz, time_zone=header.time_zone, axis=(header.time_step, start, end)
+                    )
+                )
+            return blocks[0]
+
+        index = serie.index
+        if len(index) == 0:
+            return None
+        key = (data.dtype.str, False, serie.tz, header.time_zone, len(index), index.asi8[0], index.asi8[-1])
+        blocks = self._time_blocks.setdefault(key, [])
+        for block in blocks:
+            if block.local_index.equals(index):
+                return block
+        if blocks:
+            return None  # same length and bounds, but the index differs
+        blocks.append(TimeBlock(is_binary=False, tz=serie.tz, time_zone=header.time_zone, index=index))
+        return blocks[0]
+
+    def _store(self, serie_id: str, serie: XmlTimeSeries) -> tuple:
+        data = np.asarray(serie.data)
+        block = self._time_block(serie, data)
+        if block is not None:
+            return serie.header, block, block.append(serie_id, data)
+
+        if serie.index is None:
+            raise ValueError(f"{serie_id} has no index, it cannot be stored")
+        block = self._ragged_blocks.setdefault(data.dtype.str, RaggedBlock())
+        row = block.append(serie_id, data, serie.index, serie.is_binary, serie.tz, serie.header.time_zone)
+        return serie.header, block, row
+
+    def add(self, serie: XmlTimeSeries):
+        """Add serie, raises ValueError when the id is already in the store"""
+        serie_id = serie.id
+        if serie_id in self._series:
+            raise ValueError(f"{serie_id} serie id is already part of XmlFile")
+        self[serie_id] = serie
+
+    def add_many(self, series: list) -> list:
+        """Add series, raises ValueError when an id is already in the store or occurs more than once.
+        The ids are checked once, before any serie is added. Returns the ids.
+        """
+        ids = [serie.id for serie in series]
+        duplicates = self._series.keys() & ids
+        if len(set(ids)) < len(ids):
+            duplicates |= {serie_id for serie_id, count in Counter(ids).items() if count > 1}
+        if duplicates:
+            raise ValueError(f"{sorted(duplicates)} serie ids are already part of XmlFile")
+
+        for serie_id, serie in zip(ids, series):
+            self[serie_id] = serie
+        return ids
+
+    def __setitem__(self, serie_id: str, serie: XmlTimeSeries):
+        """Add or replace serie. A replaced serie keeps its position."""
+        if serie_id in self._series:
+            self._event_columns.pop(serie_id, None)
+            self._catalogue_replaced = True
+
+        self._series[serie_id] = self._store(serie_id, serie)
+        self._header_rows[serie_id] = header_row(serie.header)
+        if serie.event_columns:
+            self._event_columns[serie_id] = serie.event_columns
+
+    def __getitem__(self, serie_id: str) -> XmlTimeSeries:
+        """View on the blocks, assigning df or data to the view replaces the serie in the store"""
+        header, block, row = self._series[serie_id]
+        serie = block.view(header, row, self._event_columns.get(serie_id))
+        serie._store = (self, serie_id)
+        return serie
+
+    def __contains__(self, serie_id: str) -> bool:
+        return serie_id in self._series
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def __iter__(self):
+        """Iterate over the series, like a pd.Series"""
+        for serie_id in self._series:
+            yield self[serie_id]
+
+    def keys(self) -> list:
+        return list(self._series)
+
+    def items(self):
+        for serie_id in self._series:
+            yield serie_id, self[serie_id]
+
+    def to_numpy(self) -> np.ndarray:
+        """Object array with the series"""
+        series = np.empty(len(self), dtype=object)
+        series[:] = list(self)
+        return series
+
+    @property
+    def index(self) -> pd.Index:
+        """Ids of the series"""
+        return pd.Index(list(self._series), dtype=object)
+
+    @property
+    def iloc(self):
+        """Positional access, xml_file.series.iloc[0]"""
+        return _StoreILoc(self)
+
+    @property
+    def headers(self) -> list:
+        """XmlHeader of every serie"""
+        return [header for header, _, _ in self._series.values()]
+
+    @property
+    def catalogue(self) -> pd.DataFrame:
+        """Header fields of all series, with a row per serie id, see header_row.
+        Rows of series added since the last call are appended to the cached DataFrame.
+        """
+        if self._catalogue is None or self._catalogue_replaced:
+            self._catalogue = header_rows_to_df(list(self._header_rows), list(self._header_rows.values()))
+            self._catalogue_replaced = False
+        elif len(self._catalogue) < len(self._header_rows):
+            ids = list(self._header_rows)[len(self._catalogue) :]
+            new_rows = header_rows_to_df(ids, [self._header_rows[serie_id] for serie_id in ids])
+            catalogue = pd.concat([self._catalogue, new_rows])
+            for column, dtype in CATALOGUE_COLUMNS.items():
+                if dtype == "category":  # concat of different categories gives object
+                    catalogue[column] = pd.Categorical(
+                        catalogue[column],
+                        categories=self._catalogue[column].cat.categories.union(new_rows[column].cat.categories),
+                    )
+            self._catalogue = catalogue
+        return self._catalogue
+
+    def subset(self, ids: list):
+        """Store with only the series in ids. Blocks are shared, the data is not copied."""
+        store = SeriesStore()
+        store._time_blocks = dict(self._time_blocks)
+        store._ragged_blocks = dict(self._ragged_blocks)
+        for serie_id in ids:
+            store._series[serie_id] = self._series[serie_id]
+            store._header_rows[serie_id] = self._header_rows[serie_id]
+            if serie_id in self._event_columns:
+                store._event_columns[serie_id] = self._event_columns[serie_id]
+        return store
+
+    def _live_rows(self, block) -> list:
+        """Rows of the block that belong to a serie of this store"""
+        rows = []
+        for row, serie_id in enumerate(block.ids):
+            entry = self._series.get(serie_id)
+            if entry is not None and entry[1] is block and entry[2] == row:
+                rows.append(row)
+        return rows
+
+    @property
+    def time_blocks(self) -> list:
+        """TimeBlocks with at least one serie of this store"""
+        return [b for blocks in self._time_blocks.values() for b in blocks if self._live_rows(b)]
+
+    @property
+    def ragged_blocks(self) -> list:
+        """RaggedBlocks with at least one serie of this store"""
+        return [b for b in self._ragged_blocks.values() if self._live_rows(b)]
+
+    def iter_groups(self):
+        """Yield (ids, index, data) for every group of series with the same index.
+        data is a 2D array with a row per id, index is tz-aware like XmlTimeSeries.df.
+        """
+        for blocks in self._time_blocks.values():
+            for block in blocks:
+                rows = self._live_rows(block)
+                if rows:
+                    data = block.data if len(rows) == len(block.ids) else block.data[rows]
+                    yield [block.ids[row] for row in rows], block.index, data
+
+        for block in self._ragged_blocks.values():
+            for row in self._live_rows(block):
+                data, index = block.row(row)
+                yield [block.ids[row]], localize_index(index, block.time_zone[row], block.tz[row]), data[np.newaxis]
+
+
+class _StoreILoc:
+    def __init__(self, store: SeriesStore):
+        self.store = store
+
+    def __getitem__(self, position: int) -> XmlTimeSeries:
+        return self.store[self.store.keys()[position]]
+
+
+def split_series(
+    series,
+    max_events: int = None,
+    max_bytes: int = None,
+    binary: bool = False,
+    time_zone: float = 0.0,
+    file_bytes: int = 0,
+    decimals: int = None,
+    significant_digits: int = None,
+) -> list:
+    """Distribute series over parts with at most max_events events and about max_bytes bytes per part.
+
+    The series are added to a part in order, a serie that does not fit in the rest of a
+    part is split in time (see XmlTimeSeries.part). The bytes are estimated from the
+    header and the first events of every serie, see XmlTimeSeries.bytes_per_event.
+    file_bytes (int): bytes of the head and closing tag, written once per part
+    decimals, significant_digits (int): precision of the written values, see format_event_values
+    Returns list of parts, every part a list of XmlTimeSeries.
+    """
+    parts = [[]]
+    events, size = 0, file_bytes
+    for serie in series:
+        n = len(serie.data)
+        header_bytes = len(serie.header.to_str(indent=2, dates=binary)) + len("\t<series>\n\n\t</series>")
+        event_bytes = 0
+        if max_bytes:
+            event_bytes = serie.bytes_per_event(
+                binary=binary, time_zone=time_zone, decimals=decimals, significant_digits=significant_digits
+            )
+
+        position = 0
+        while position < n or (n == 0 and position == 0):
+            fits = n - position
+            if max_events is not None:
+                fits = min(fits, max_events - events)
+            if max_bytes is not None:
+                fits = min(fits, int((max_bytes - size - header_bytes) // max(event_bytes, 1)))
+            if fits <= 0 < n and len(parts[-1]) > 0:
+                # Start a new part, at least one event is written per part.
+                parts.append([])
+                events, size = 0, file_bytes
+                continue
+
+            fits = max(fits, min(n, 1))
+            whole = position == 0 and fits == n
+            parts[-1].append(serie if whole else serie.part(slice(position, position + fits)))
+            events += fits
+            size += header_bytes + fits * event_bytes
+            position += max(fits, 1)
+    return parts
+
+
+def check_output_paths(paths: list, compression="infer", binary: bool = False):
+    """Raise FileExistsError when one of the output paths, or the .bin next to it, already exists"""
+    for path in paths:
+        binfile_path = bin_output_path(path, compression) if binary else None
+        for output_path in [path, binfile_path]:
+            if output_path is not None and output_path.exists():
+                raise FileExistsError(f"{output_path} already exists")
+
+
+def manifest_entry(serie: XmlTimeSeries, time_zone: float = 0.0) -> dict:
+    """Id, number of events and written start and end of a serie in the manifest of XmlFile.write"""
+    n = len(serie.data)
+    if n == 0:
+        return {"id": serie.id, "events": 0, "start": None, "end": None}
+    start = serie.written_index_at(slice(0, 1), time_zone)[0]
+    end = serie.written_index_at(slice(n - 1, n), time_zone)[0]
+    return {"id": serie.id, "events": n, "start": start.isoformat(), "end": end.isoformat()}
+
+
+def write_series(
+    series,
+    output_path,
+    head: str,
+    tzone: str = "0.0",
+    compression="infer",
+    binary: bool = False,
+    decimals: int = None,
+    significant_digits: int = None,
+):
+    """Write series to one xml (and .bin), see XmlFile.write.
+    Every serie is written in chunks of events, the file is never built in memory.
+    The dates and times of the events are formatted once per distinct index, see EventTemplates.
+    """
+    templates = EventTemplates()
+    with open_xml_writer(output_path, compression=compression) as open_output:
+        with open_output(".xml") as f:
+            f.write(f"{head}<timeZone>{float(tzone)}</timeZone>\n".encode())
+            for serie in series:
+                f.writelines(
+                    serie.iter_xml(
+                        time_zone=float(tzone),
+                        binary=binary,
+                        decimals=decimals,
+                        significant_digits=significant_digits,
+                        templates=templates,
+                    )
+                )
+            f.write(b"</TimeSeries>")
+
+        if binary:
+            # The values of the series follow each other in the order of the headers.
+            with open_output(".bin") as f:
+                for serie in series:
+                    serie.write_bin(f)
+
+
 class XmlFile(hrt.File):
     """Mother of all classes.
     XmlFile can both be a binary or non-binary file.
-    The file is a collection of TimeSeries that are stored in the .series attribute.
+    The file is a collection of TimeSeries that are stored in the .series attribute,
+    see SeriesStore.
 
     Can read xml to df and write back to file
     """
@@ -349,55 +1820,320 @@ class XmlFile(hrt.File):
         self.head = '<?xml version="1.0" ?>\n<TimeSeries xmlns="http://www.wldelft.nl/fews/PI" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://www.wldelft.nl/fews/PI http://fews.wldelft.nl/schemas/version1.0/pi-schemas/pi_timeseries.xsd" version="1.22">\n'
 
         # collection of TimeSeries
-        self.series = pd.Series()
+        self.series = SeriesStore()
 
         # Filled at runtime.
         self.header_base = None
+        # Start and stop offset in the .bin per series id, only for binary files.
+        self.bin_offsets = None
 
     @classmethod
-    def from_xml_file(cls, xml_path):
-        """Read xml file and return XmlFile object"""
+    def from_xml_file(
+        cls,
+        xml_path,
+        location_ids=None,
+        parameter_ids=None,
+        qualifier_ids=None,
+        start=None,
+        end=None,
+        workers: int = None,
+        tz="UTC",
+        dtype=None,
+    ):
+        """Read xml file and return XmlFile object
+
+        The xml can be compressed, see XmlFile.iter_sources. A zip with several xml
+        files is read into one XmlFile.
+
+        Optionally only a part of the file is read, the filters are checked while the
+        xml is parsed so unselected series and events are never converted.
+
+        location_ids, parameter_ids (str, list): only read series with one of these ids
+        qualifier_ids (str, list): only read series that have at least one of these qualifiers
+        start, end (datetime, str): only read events within this time window. Naive datetimes
+            are in the PI timeZone of the file, tz-aware datetimes are converted to it.
+        workers (int): parse a non-binary xml in this many processes, the file is split
+            at series boundaries. Binary and compressed xml are always read in one process.
+            On Windows call this from within an `if __name__ == "__main__":` block.
+        tz (str, tzinfo): the <timeZone> of the file is applied to every index, which is
+            tz-aware in UTC or in this time zone. None keeps the naive datetimes of the file.
+        dtype (str, np.dtype): dtype of the values. None keeps the float32 of a .bin (as a
+            zero-copy view) and reads the values of a non-binary xml as float64. Use 'float32'
+            to halve the memory of a non-binary xml.
+        """
 
         xml_file = XmlFile(xml_path=xml_path)
+        filter_kwargs = {
+            "location_ids": location_ids,
+            "parameter_ids": parameter_ids,
+            "qualifier_ids": qualifier_ids,
+            "start": start,
+            "end": end,
+        }
+        is_filtered = any(i is not None for i in filter_kwargs.values())
+
+        if workers is not None and workers > 1 and not xml_file.is_binary and xml_file.compression is None:
+            from hhnk_fewspy.xml_parallel import read_xml_file_chunks
+
+            series = read_xml_file_chunks(
+                xml_file.path, xml_filter=XmlFilter(**filter_kwargs), workers=workers, tz=tz, dtype=dtype
+            )
+        else:
+            series = cls.iter_series(xml_path, **filter_kwargs, tz=tz, dtype=dtype)
 
-        # Read data
-        xml_data = objectify.parse(xml_file.base)  # Parse XML data
-        root = xml_data.getroot()  # Root element
+        # A filtered file is only part of the .bin, it has no offset table.
+        xml_file.add_read_series(list(series), has_bin_offsets=xml_file.is_binary and not is_filtered)
+        return xml_file
 
-        # Get children, filter out timezone.
-        rootchildren = [child for child in root.getchildren() if child.tag.endswith("series")]
+    @classmethod
+    def from_stream(
+        cls,
+        stream,
+        bin_buffer=None,
+        location_ids=None,
+        parameter_ids=None,
+        qualifier_ids=None,
+        start=None,
+        end=None,
+        tz="UTC",
+        dtype=None,
+    ):
+        """Read xml from a file object and return XmlFile object, nothing is written to disk.
+
+        stream (file object): binary file object with a read method, e.g. an open file,
+            io.BytesIO, a socket file or the response of urllib.request.urlopen. The xml is
+            parsed while it is read.
+        bin_buffer (bytes, memoryview, mmap, np.ndarray): contents of the .bin for a binary
+            xml. The values are a zero-copy float32 view on the buffer (np.frombuffer).
+        See from_xml_file for the filter, tz and dtype arguments.
+        """
+        xml_filter = XmlFilter(
+            location_ids=location_ids, parameter_ids=parameter_ids, qualifier_ids=qualifier_ids, start=start, end=end
+        )
+        bin_values = None if bin_buffer is None else np.frombuffer(bin_buffer, dtype=np.float32)
+        series = cls.iter_source_series(
+            stream, bin_values=bin_values, xml_filter=xml_filter, tz=tz, dtype=dtype, name="stream"
+        )
 
-        # Check if there is a bin file
-        is_binary = xml_file.is_binary  # local variable for speed
-        if is_binary:
-            bin_values = np.fromfile(xml_file.binfile_path, dtype=np.float32, offset=0, count=-1)
-            bin_size = int(len(bin_values) / len(rootchildren))
+        xml_file = XmlFile(xml_path=None)
+        is_filtered = xml_filter != XmlFilter()
+        xml_file.add_read_series(list(series), has_bin_offsets=bin_values is not None and not is_filtered)
+        return xml_file
 
-        # Loop over children (individual timeseries in the xml)
-        for i, child in enumerate(rootchildren):
-            subchildren = child.getchildren()  # alle headers en en timevalues
+    @classmethod
+    def from_buffer(cls, buffer, bin_buffer=None, **kwargs):
+        """Read xml from a buffer (bytes, bytearray, memoryview, mmap) and return XmlFile object.
+        The xml is parsed from the buffer in chunks without copying it, see from_stream for the arguments.
+        """
+        return cls.from_stream(BufferReader(buffer), bin_buffer=bin_buffer, **kwargs)
+
+    @classmethod
+    def from_bytes(cls, xml_bytes, bin_bytes=None, **kwargs):
+        """Read xml from bytes (or str), e.g. the body of an HTTP response, see from_stream."""
+        if isinstance(xml_bytes, str):
+            xml_bytes = xml_bytes.encode()
+        return cls.from_buffer(xml_bytes, bin_buffer=bin_bytes, **kwargs)
+
+    @classmethod
+    def iter_series(
+        cls,
+        xml_path,
+        location_ids=None,
+        parameter_ids=None,
+        qualifier_ids=None,
+        start=None,
+        end=None,
+        tz="UTC",
+        dtype=None,
+    ):
+        """Yield the XmlTimeSeries in an xml file one at a time.
+
+        The xml is read with iterparse and every <series> element is cleared
+        once its XmlTimeSeries is built, so peak memory is bounded by the
+        largest single series instead of the whole document.
+        For binary files the .bin is memory mapped and each series gets a
+        zero-copy view on it. Series can differ in length, the offset of each
+        series is derived from the headers (startDate, endDate, timeStep) and
+        the total is checked against the size of the .bin.
+
+        See from_xml_file for the filter, tz and dtype arguments. The filter is checked when the header
+        is parsed, events of unselected series are skipped and series without events in
+        the time window are not yielded.
+        """
+        xml_file = XmlFile(xml_path=xml_path)
+        xml_filter = XmlFilter(
+            location_ids=location_ids, parameter_ids=parameter_ids, qualifier_ids=qualifier_ids, start=start, end=end
+        )
+        for name, source, bin_values in xml_file.iter_sources():
+            yield from cls.iter_source_series(
+                source, bin_values=bin_values, xml_filter=xml_filter, tz=tz, dtype=dtype, name=name
+            )
+
+    @classmethod
+    def iter_source_series(
+        cls, source, bin_values: np.ndarray = None, xml_filter=None, tz="UTC", dtype=None, name: str = "xml"
+    ):
+        """Yield the XmlTimeSeries of one parsed xml source, see iter_series.
+
+        source (str, file object): path or (decompressing) file object that iterparse reads from
+        bin_values (np.ndarray): float32 values of the .bin, None for a non-binary xml
+        xml_filter (XmlFilter): selection of series and events, None reads everything
+        name (str): name of the xml in error messages
+        """
+        if xml_filter is None:
+            xml_filter = XmlFilter()
+
+        # Check if there is a bin file
+        is_binary = bin_values is not None  # local variable for speed
+        bin_offset = 0
+
+        header = None
+        # A document without <timeZone> is in 0.0 (UTC), the time window is converted to it until one is found.
+        time_zone = 0.0
+        window_filter = xml_filter
+        xml_filter = window_filter.in_time_zone(time_zone)
+        for _, child in etree.iterparse(
+            source,
+            events=("end",),
+            tag=("{*}timeZone", "{*}header", "{*}series"),
+            remove_blank_text=True,
+        ):
+            # The timeZone of the document comes before the series.
+            if child.tag.endswith("timeZone"):
+                time_zone = float(child.text)
+                xml_filter = window_filter.in_time_zone(time_zone)
+                continue
+
+            # The header ends before the events of a series are parsed.
+            if child.tag.endswith("header"):
+                header = XmlHeader.from_pi_header_element(child, time_zone=time_zone)
+                continue
+
+            serie = None
+            if xml_filter.select_header(header):
+                serie = XmlTimeSeries.from_pi_series_element(
+                    child, header=header, is_binary=is_binary, xml_filter=xml_filter, tz=tz, dtype=dtype
+                )
+
+            if is_binary:
+                # Series are stored consecutively in the bin, also skipped series move the offset.
+                bin_size = header.timesteps
+                if bin_size is None:
+                    bin_size = sum(1 for _ in child.iterchildren(EVENT_TAG))
+                if bin_offset + bin_size > len(bin_values):
+                    raise ValueError(
+                        f"{name} has {len(bin_values)} bin values, header of {header.id} needs values "
+                        f"up to {bin_offset + bin_size}"
+                    )
+                if serie is not None:
+                    serie.data = bin_values[bin_offset : bin_offset + bin_size]
+                    if xml_filter.has_time_window:
+                        serie.slice_time(start=xml_filter.start, end=xml_filter.end)
+                    if dtype is not None:
+                        serie.data = serie.data.astype(dtype, copy=False)
+                bin_offset += bin_size
+
+            # Free the parsed element and its already processed siblings.
+            child.clear()
+            while child.getprevious() is not None:
+                del child.getparent()[0]
             header = None
-            data = []
 
-            for subchild in subchildren:
-                # Write header to dict
-                if subchild.tag.endswith("header"):  # gewoonlijk eerste subchild is de header
-                    header = XmlHeader.from_pi_header_element(subchild)
-                # Else get data
-                else:
-                    data.append(subchild.values())
+            # Series without events are kept, unless the time window of the filter left no events.
+            if serie is not None and (len(serie.data) > 0 or not xml_filter.has_time_window):
+                yield serie
+
+        if is_binary and bin_offset != len(bin_values):
+            raise ValueError(f"{name} has {len(bin_values)} bin values, the headers describe {bin_offset} values")
+
+    @classmethod
+    def read_series(
+        cls, xml_path, location_id=None, parameter_id=None, rebuild_index: bool = False, tz="UTC", dtype=None
+    ):
+        """Read only the selected series of an xml file and return XmlFile object.
 
-                # If binary we assume equidistant series with equal length.
+        Uses the sidecar index (see XmlIndex) to seek to the bytes of the selected series,
+        the rest of the xml is not parsed. The index is built on first use.
+
+        location_id (str, list): location id(s) to read, None reads all
+        parameter_id (str, list): parameter id(s) to read, None reads all
+        tz (str, tzinfo): time zone of the indexes, see from_xml_file
+        dtype (str, np.dtype): dtype of the values, see from_xml_file
+        """
+        from hhnk_fewspy.xml_index import XmlIndex, parse_fragment
+
+        xml_file = XmlFile(xml_path=xml_path)
+        if xml_file.compression is not None:
+            raise ValueError(f"{xml_file.name} is compressed and cannot be indexed, use from_xml_file with filters")
+        xml_index = XmlIndex.from_xml_file(xml_path, rebuild=rebuild_index)
+
+        is_binary = xml_file.is_binary
+        if is_binary:
+            bin_values = open_bin_values(xml_file.binfile_path)
+            n_values = int(xml_index.df["bin_stop"].iloc[-1]) if len(xml_index.df) > 0 else 0
+            if n_values != len(bin_values):
+                raise ValueError(
+                    f"{xml_file.name} has {len(bin_values)} bin values, the headers describe {n_values} values"
+                )
+
+        with open(xml_file.path, "rb") as f:
+            for row in xml_index.select(location_id=location_id, parameter_id=parameter_id).itertuples():
+                f.seek(row.byte_start)
+                series_element = parse_fragment(f.read(row.byte_stop - row.byte_start), xml_index.root_tag)[0]
+
+                serie = XmlTimeSeries.from_pi_series_element(
+                    series_element, is_binary=is_binary, time_zone=xml_index.time_zone, tz=tz, dtype=dtype
+                )
                 if is_binary:
-                    data = bin_values[i * bin_size : i * bin_size + bin_size]
+                    serie.data = bin_values[row.bin_start : row.bin_stop]
+                    if dtype is not None:
+                        serie.data = serie.data.astype(dtype, copy=False)
+                xml_file.add_time_series(serie=serie)
+        return xml_file
+
+    @classmethod
+    def from_directory(
+        cls,
+        path,
+        pattern: str = "*.xml",
+        workers: int = None,
+        on_duplicate: str = "raise",
+        tz="UTC",
+        dtype=None,
+    ):
+        """Read all xml files in a directory into one XmlFile.
+
+        The files are parsed in parallel worker processes. On Windows call this
+        from within an `if __name__ == "__main__":` block.
+
+        path (str, Path, hrt.Folder): directory with xml files
+        pattern (str): glob pattern of the files to read
+        workers (int): number of worker processes, defaults to the number of cpus
+        on_duplicate (str): what to do when a series id is in more than one file
+            'raise': raise ValueError
+            'first': keep the serie of the first file (sorted by name)
+            'last': keep the serie of the last file (sorted by name)
+        tz (str, tzinfo): time zone of the indexes, see from_xml_file. Files with
+            another <timeZone> are all converted to this zone.
+        dtype (str, np.dtype): dtype of the values, see from_xml_file
+        """
+        from hhnk_fewspy.xml_parallel import read_xml_files
 
-            # columns = subchild.keys()
-            if header is None:
-                raise ValueError("Header should not be None at this point")
+        if on_duplicate not in ["raise", "first", "last"]:
+            raise ValueError(f"on_duplicate should be 'raise', 'first' or 'last', got {on_duplicate}")
 
-            serie = XmlTimeSeries(header=header, data=data, is_binary=is_binary)
-            xml_file.add_time_series(serie=serie)
+        xml_paths = sorted(Path(str(path)).glob(pattern))
 
+        xml_file = XmlFile(xml_path=None)
+        for series in read_xml_files(xml_paths, workers=workers, tz=tz, dtype=dtype):
+            for serie in series:
+                if serie.id in xml_file.series:
+                    if on_duplicate == "first":
+                        continue
+                    if on_duplicate == "last":
+                        xml_file.series[serie.id] = serie
+                        continue
+                xml_file.add_time_series(serie=serie)
         return xml_file
 
     @classmethod
@@ -407,19 +2143,36 @@ class XmlFile(hrt.File):
         """
         xml_file = XmlFile(xml_path=None)
 
+        index = pd.DatetimeIndex(df.index).as_unit("ns")
+        time_step = XmlTimeStep.from_index(index)
+
+        # All series share the index and get a contiguous row of one array per dtype, see XmlTimeSeries.from_df.
+        # Columns are grouped by dtype first, so an int column is not converted to the float of another column.
+        local_index = delocalize_index(index, time_zone=0.0)
+        dtypes = df.dtypes.to_numpy()
+        values = [None] * len(df.columns)
+        for dtype in pd.unique(dtypes):
+            positions = np.flatnonzero(dtypes == dtype)
+            columns = df if len(positions) == len(dtypes) else df.iloc[:, positions]
+            for position, row in zip(positions, np.ascontiguousarray(columns.to_numpy().T)):
+                values[position] = row
+
         # iter over columns and add each as time series.
-        for series_name, s in df.items():
+        series = []
+        for column, series_name in enumerate(df.columns):
             series_header = XmlHeader(
                 location_id=series_name.split("__")[0],
                 module_instance_id=module_instance_id,
                 parameter_id=parameter_id,
                 qualifier_ids=qualifier_ids,
+                time_step=time_step,
                 miss_val=miss_val,
+                time_zone=0.0 if index.tz is not None else None,
             )
 
-            serie = XmlTimeSeries.from_df(header=series_header, df_serie=s)
+            series.append(XmlTimeSeries(header=series_header, data=values[column], index=local_index, tz=index.tz))
 
-            xml_file.add_time_series(serie=serie)
+        xml_file.add_many(series)
         return xml_file
 
     @property
@@ -428,9 +2181,13 @@ class XmlFile(hrt.File):
         """Path to binfile if it exists, otherwise returns None.
         Binfile should have same name as the xml and should be in same folder.
         """
-        binfile_path = self.path.with_suffix(".bin")
-        if binfile_path.exists():
-            return binfile_path
+        if self.compression == "zip":
+            return None  # the .bin is a member of the zip, see iter_sources
+
+        xml_path = self.path.with_suffix("") if self.compression == "gzip" else self.path
+        for binfile_path in [xml_path.with_suffix(".bin"), xml_path.with_suffix(".bin.gz")]:
+            if binfile_path.exists():
+                return binfile_path
         return None
 
     @property
@@ -441,69 +2198,291 @@ class XmlFile(hrt.File):
             return False
         return True
 
+    @property
+    def compression(self):
+        """Compression of the xml by suffix, 'gzip' (.gz), 'zip' (.zip) or None"""
+        return infer_compression(self.path)
+
+    def iter_sources(self):
+        """Yield (name, source, bin_values) of every xml in the file, without temporary files.
+
+        - xml: the path and the memory mapped .bin.
+        - .xml.gz: the xml is decompressed while it is parsed. The .bin can be a .bin or .bin.gz
+          next to it, a compressed .bin is decompressed into memory.
+        - .zip: every .xml member (sorted by name) with the .bin member of the same name.
+        bin_values is None for a non-binary xml.
+        """
+        compression = self.compression
+        if compression == "zip":
+            with zipfile.ZipFile(self.path) as archive:
+                members = set(archive.namelist())
+                for member in sorted(m for m in members if m.lower().endswith(".xml")):
+                    bin_values = None
+                    bin_member = f"{member[:-4]}.bin"
+                    if bin_member in members:
+                        with archive.open(bin_member) as f:
+                            bin_values = read_bin_values(f)
+                    with archive.open(member) as f:
+                        yield f"{self.name}/{member}", f, bin_values
+            return
+
+        binfile_path = self.binfile_path
+        bin_values = None
+        if binfile_path is not None and binfile_path.suffix == ".gz":
+            with gzip.open(binfile_path) as f:
+                bin_values = read_bin_values(f)
+        elif binfile_path is not None:
+            bin_values = open_bin_values(binfile_path)
+
+        if compression == "gzip":
+            with gzip.open(self.path) as f:
+                yield self.name, f, bin_values
+        else:
+            yield self.name, self.base, bin_values
+
+    def add_read_series(self, series: list, has_bin_offsets: bool):
+        """Add the series of a read xml. With has_bin_offsets the offsets of the
+        binary series in the .bin are stored in .bin_offsets.
+        """
+        self.add_many(series)
+        if has_bin_offsets:
+            offsets = bin_offsets([len(serie.data) for serie in series if serie.is_binary])
+            self.bin_offsets = pd.DataFrame({"start": offsets[:-1], "stop": offsets[1:]}, index=self.series.index)
+
     def add_time_series(self, serie: XmlTimeSeries) -> XmlTimeSeries.id:
         """Add timeseries .series.
         Returns the id of the series that was added
         """
-        if serie.id not in self.series:
-            self.series[serie.id] = serie
-            return serie.id
-        raise ValueError(f"{serie.id} serie id is already part of XmlFile")
+        self.series.add(serie)
+        return serie.id
+
+    def add_many(self, series: list) -> list:
+        """Add timeseries to .series in one go. All ids are checked for duplicates
+        before a serie is added, a ValueError leaves the file unchanged.
+        Returns the ids of the series that were added
+        """
+        return self.series.add_many(series)
 
     def print(self, tzone="0.0"):
         """Print timeseries as it would get written to xml."""
         print(self.head)
-        print(f"<timeZone>{tzone}</timeZone>\n")
+        print(f"<timeZone>{float(tzone)}</timeZone>\n")
         for serie in self.series.to_numpy():
-            print(serie.to_str())
+            print(serie.to_str(time_zone=float(tzone)))
         print("</TimeSeries>")
 
-    def write(self, output_path: Union[str, Path, hrt.File] = None, tzone: str = "0.0"):
-        """Write timeseries to an xml file."""
+    def write(
+        self,
+        output_path: Union[str, Path, hrt.File] = None,
+        tzone: str = "0.0",
+        compression="infer",
+        binary: bool = False,
+        max_events_per_file: int = None,
+        max_bytes_per_file: int = None,
+        part_name: str = "{stem}_{part:03d}",
+        workers: int = None,
+        decimals: int = None,
+        significant_digits: int = None,
+    ):
+        """Write timeseries to an xml file, or to several parts.
+
+        tzone (str, float): PI timeZone of the file in hours relative to UTC. Series
+            are shifted from the timeZone they were read in to this zone, the naive index of a df
+            (see from_df) is written as it is.
+        compression (str): 'gzip', 'zip' or None. 'infer' compresses an output_path
+            ending with .gz or .zip. A zip contains the xml as <stem>.xml.
+        binary (bool): write a binary file, the xml only has headers (with startDate, endDate
+            and timeStep) and the values of all series are written as float32 to one .bin next
+            to it (<stem>.bin in a zip). NaN is written as the missVal of the serie.
+            The timestep of every serie is checked, see XmlTimeSeries.binary_time_step.
+        max_events_per_file (int): split the output in parts with at most this many events per file
+        max_bytes_per_file (int): split the output in parts of about this many bytes (xml and .bin,
+            before compression). See split_series for how the series are split.
+        part_name (str): name of the parts, formatted with the stem of output_path and the part
+            number. The suffix of output_path is appended, e.g. out_000.xml.gz
+        workers (int): number of threads that write the parts at the same time
+        decimals (int): round the event values to this number of decimals, e.g. 2 writes 1.23
+            for 1.23456. The values are written in their shortest repr, so 1.5 stays 1.5.
+        significant_digits (int): round every event value to this number of significant
+            digits instead, e.g. 3 writes 1230.0 for 1234.5 and 0.00123 for 0.0012345.
+            Neither is used for binary files. NaN is always written as the missVal of the serie.
+
+        Returns
+        -------
+        manifest (dict): only when the output is split, the parts with the series and time range in
+            every part. It is also written next to the parts as <stem>.manifest.json
+        """
         if output_path is not None:
             output_path = hrt.File(output_path)
 
-        if output_path.exists():
-            raise FileExistsError(f"{output_path.base} already exists")
-
-        with open(output_path.path, "w") as f:
-            f.write(self.head)
-            f.write(f"<timeZone>{tzone}</timeZone>\n")
-            for serie in self.series.to_numpy():
-                f.write(serie.to_str())
-            f.write("</TimeSeries>")
-
-    def to_df(self, miss_val_to_nan=False):
+        if max_events_per_file is None and max_bytes_per_file is None:
+            check_output_paths([output_path.path], compression=compression, binary=binary)
+            write_series(
+                self.series,
+                output_path.path,
+                head=self.head,
+                tzone=tzone,
+                compression=compression,
+                binary=binary,
+                decimals=decimals,
+                significant_digits=significant_digits,
+            )
+            return None
+
+        compression = infer_compression(output_path.path, compression)
+        suffix = "".join(output_path.path.suffixes[-2:]) if compression == "gzip" else output_path.path.suffix
+        stem = output_path.name[: len(output_path.name) - len(suffix)]
+        manifest_path = output_path.path.with_name(f"{stem}.manifest.json")
+
+        parts = split_series(
+            self.series,
+            max_events=max_events_per_file,
+            max_bytes=max_bytes_per_file,
+            binary=binary,
+            time_zone=float(tzone),
+            file_bytes=len(f"{self.head}<timeZone>{float(tzone)}</timeZone>\n</TimeSeries>"),
+            decimals=decimals,
+            significant_digits=significant_digits,
+        )
+        paths = [output_path.path.with_name(part_name.format(stem=stem, part=i) + suffix) for i in range(len(parts))]
+        check_output_paths(paths, compression=compression, binary=binary)
+        if manifest_path.exists():
+            raise FileExistsError(f"{manifest_path} already exists")
+
+        # The parts share no files, they are written by threads at the same time.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    write_series,
+                    part,
+                    path,
+                    head=self.head,
+                    tzone=tzone,
+                    compression=compression,
+                    binary=binary,
+                    decimals=decimals,
+                    significant_digits=significant_digits,
+                )
+                for path, part in zip(paths, parts)
+            ]
+            for future in futures:
+                future.result()
+
+        manifest = {
+            "time_zone": float(tzone),
+            "binary": binary,
+            "parts": [
+                {
+                    "path": path.name,
+                    "events": sum(len(serie.data) for serie in part),
+                    "series": [manifest_entry(serie, time_zone=float(tzone)) for serie in part],
+                }
+                for path, part in zip(paths, parts)
+            ],
+        }
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        return manifest
+
+    def to_df(self, miss_val_to_nan=False, dtype=None):
         """Get combined df of all timeseries in file
 
+        The values are copied block by block into one preallocated array. When the
+        series do not share one index they are aligned on the union of all indexes,
+        timesteps a serie does not have are NaN.
+
         Parameters
         ----------
-        replace_miss_val (bool)
+        miss_val_to_nan (bool)
             replace missing value with np.nan
+        dtype (str, np.dtype)
+            dtype of the df, by default the dtype of the series. Series read from a
+            .bin stay float32, also when missing values are replaced. Integer series
+            become float when they get NaN values.
         """
-        df_ts = pd.concat([v.df.rename(columns={"value": k}) for k, v in self.series.items()], axis=1)
+        ids = self.series.keys()
+        groups = list(self.series.iter_groups())
+        if len(groups) == 0:
+            return pd.DataFrame()
+
+        indexes = [index for _, index, _ in groups]
+        if len({index.tz for index in indexes}) > 1:
+            raise ValueError("Series with different time zones cannot be combined in one df")
+        if dtype is None:
+            dtype = np.result_type(*[data.dtype for _, _, data in groups])
+
+        aligned = all(index.equals(indexes[0]) for index in indexes[1:])
+        if miss_val_to_nan or not aligned:
+            dtype = np.result_type(dtype, np.float32)  # NaN needs a float dtype, float32 stays float32
+        if aligned:
+            index = indexes[0]
+            values = np.empty((len(index), len(ids)), dtype=dtype)
+        else:
+            # Union of all indexes, computed once on the int64 ns values.
+            union = np.unique(np.concatenate([index.as_unit("ns").asi8 for index in indexes]))
+            index = pd.DatetimeIndex(union.view("datetime64[ns]"))
+            if indexes[0].tz is not None:
+                index = index.tz_localize("UTC").tz_convert(indexes[0].tz)
+            values = np.full((len(index), len(ids)), np.nan, dtype=dtype)
+
+        columns = {serie_id: column for column, serie_id in enumerate(ids)}
+        for group_ids, group_index, data in groups:
+            group_columns = np.array([columns[serie_id] for serie_id in group_ids])
+            if aligned:
+                values[:, group_columns] = data.T
+            else:
+                rows = np.searchsorted(index.asi8, group_index.as_unit("ns").asi8)
+                values[np.ix_(rows, group_columns)] = data.T
 
         if miss_val_to_nan:
-            miss_series = pd.Series([v.header.miss_val for k, v in self.series.items()])
-            miss_series.index = self.series.keys()
-            df_ts.replace(miss_series, np.nan, inplace=True)
+            # One broadcast comparison with the missVal of every column.
+            miss_vals = self.headers["miss_val"].to_numpy()
+            values[values == miss_vals.astype(dtype)] = np.nan
+
+        return pd.DataFrame(values, index=index, columns=ids, copy=False)
+
+    @property
+    def headers(self) -> pd.DataFrame:
+        """Header fields of all series as DataFrame with a row per serie id.
+        start_date and end_date are in the PI timeZone of the file they were read from.
+        The DataFrame is cached and extended when series are added, do not modify it.
+        """
+        return self.series.catalogue
+
+    def select(self, **columns):
+        """Select series on their header fields, see XmlFile.headers for the columns.
+        Returns XmlFile with the selected series, these are views on the data of this file.
 
-        return df_ts
+        example: xml_file.select(parameter_id="H.meting", location_id=["a", "b"])
+        """
+        headers = self.headers
+        mask = np.ones(len(headers), dtype=bool)
+        for column, selection in columns.items():
+            if column not in headers.columns:
+                raise ValueError(f"{column} is not a header column, use one of {list(headers.columns)}")
+            if isinstance(selection, (list, tuple, set, np.ndarray, pd.Index)):
+                mask &= headers[column].isin(selection).to_numpy()
+            else:
+                mask &= (headers[column] == selection).to_numpy()
+
+        xml_file = XmlFile(xml_path=None)
+        xml_file.series = self.series.subset(headers.index[mask])
+        return xml_file
 
     @property
     def series__location_ids(self) -> list:
         """List of unique location ids in the series"""
-        return list(set(self.series.apply(lambda x: x.header.location_id).tolist()))
+        return self.headers["location_id"].unique().tolist()
 
     @property
     def series__start_date(self) -> datetime.datetime:
         """Min start time in all series"""
-        return min(self.series.apply(lambda x: x.header.start_date.date_time).tolist()).to_pydatetime()
+        return self.headers["start_date"].min().to_pydatetime()
 
     @property
     def series__end_date(self) -> datetime.datetime:
         """Max end time in all series"""
-        return max(self.series.apply(lambda x: x.header.end_date.date_time).tolist()).to_pydatetime()
+        return self.headers["end_date"].max().to_pydatetime()
 
 
 class DataFrameTimeseries:
@@ -1,12 +1,9 @@
 # %%
-from pathlib import Path
-
 import numpy as np
 import pandas as pd
-from lxml import objectify
 
 from hhnk_fewspy.api_functions import connect_API
-from hhnk_fewspy.xml_classes import XmlHeader, XmlTimeSeries
+from hhnk_fewspy.xml_classes import XmlFile, XmlHeader
 
 
 # TODO xml classes gebruiken ipv connect_API
@@ -33,81 +30,39 @@ def df_to_xml(df, ts_header: XmlHeader, out_path=None):
         f.write(pi_ts_xml)
 
 
-# TODO XmlTimeSeries ipv XmlSeries gebruiken?
-def xml_to_dict(xml_path, binary: bool = False):
-    """#TODO add timezone (assume UTC now)"""
-    if binary:
-        binfile_path = Path(xml_path).with_suffix(".bin")
-        bin_values = np.fromfile(
-            binfile_path,
-            dtype=np.float32,
-            offset=0,
-            count=-1,
-        )
-
-    # Read headers
-    xml_data = objectify.parse(xml_path)  # Parse XML data
-    root = xml_data.getroot()  # Root element
+def xml_to_dict(xml_path, binary: bool = False, tz="UTC", dtype=None):
+    """Read xml to a dict of XmlTimeSeries as {location_id: {parameter_id: XmlTimeSeries}}.
 
+    binary (bool): kept for backwards compatibility. A file is read as binary when
+        a .bin with the same name exists, with the offset of every series derived from its header.
+    tz (str, tzinfo): the <timeZone> of the xml is applied, indexes are tz-aware in this zone.
+        None keeps the naive datetimes of the xml.
+    dtype (str, np.dtype): dtype of the values, see XmlFile.from_xml_file
+    """
     series = {}
-
-    # Get children, filter out timezone.
-    rootchildren = [child for child in root.getchildren() if child.tag.endswith("series")]
-
-    # Loop over children (individual timeseries in the xml)
-    for i, child in enumerate(rootchildren):
-        subchildren = child.getchildren()  # alle headers en en timevalues
-        metadata = None
-        data = []
-        columns = None
-
-        for subchild in subchildren:
-            # Write header to dict
-            if subchild.tag.endswith("header"):  # gewoonlijk eerste subchild is de header
-                header_childs = subchild.getchildren()
-                metadata = {}
-                for item in header_childs:
-                    key = item.tag.split("}")[-1]
-
-                    item_keys = item.keys()
-
-                    if len(item_keys) == 0:
-                        metadata[key] = item.text
-                    else:
-                        metadata[key] = {}
-                        for item_key, item_value in zip(item_keys, item.values()):
-                            metadata[key][item_key] = item_value
-            # Get data
-            else:
-                data.append(subchild.values())
-
-            # If binary we assume equidistant series with equal length.
-            if binary:
-                bin_size = int(len(bin_values) / len(rootchildren))
-                data = bin_values[i * bin_size : i * bin_size + bin_size]
-
-        columns = subchild.keys()
-        serie = XmlTimeSeries(header=metadata, data=data, columns=columns, binary=binary)
-
-        if serie.locid not in series.keys():
-            series[serie.locid] = {}
-        series[serie.locid][serie.paramid] = serie
+    for serie in XmlFile.iter_series(xml_path, tz=tz, dtype=dtype):
+        location_id = serie.header.location_id
+        if location_id not in series.keys():
+            series[location_id] = {}
+        series[location_id][serie.header.parameter_id] = serie
 
     return series
 
 
-def xml_to_df(xml_path, binary: bool, parameter: str):
+def xml_to_df(xml_path, binary: bool, parameter: str, tz="UTC", dtype=None):
     """Turn dict of input binary to dataframe with every column another timeserie"""
-    xmldict = xml_to_dict(xml_path=xml_path, binary=binary)
+    xmldict = xml_to_dict(xml_path=xml_path, binary=binary, tz=tz, dtype=dtype)
 
     print([xmldict[key].keys() for key in xmldict])
 
     cols = [key for key in xmldict if parameter in xmldict[key].keys()]
+    if len(cols) == 0:
+        raise ValueError(f"Parameter {parameter} not found in {xml_path}")
     time_df = pd.DataFrame(index=xmldict[cols[0]][parameter].df.index, columns=cols)
 
     for col in cols:
-        missval = float(xmldict[col][parameter].metadata["missVal"])
-        time_df[col] = xmldict[col][parameter].df.replace(missval, np.nan)
+        serie = xmldict[col][parameter]
+        time_df[col] = serie.df["value"].replace(serie.header.miss_val, np.nan)
     return time_df
 
 
@@ -134,6 +89,6 @@ if __name__ == "__main__":
 
     xml_path = FOLDER_DATA.bin_test_series.base
     binary = True
-    parameter = ""
+    parameter = "H.meting"
 
     xml_to_df(xml_path=xml_path, binary=binary, parameter=parameter)
@@ -0,0 +1,194 @@
+# %%
+import json
+import mmap
+import re
+
+import hhnk_research_tools as hrt
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from hhnk_fewspy.xml_classes import XmlFile, XmlHeader, bin_offsets
+
+# Byte patterns, the xml is scanned without parsing it. Tags may have a namespace prefix.
+ROOT_PATTERN = re.compile(rb"<((?:[\w.-]+:)?TimeSeries)[\s>][^>]*>")
+SERIES_PATTERN = re.compile(rb"<((?:[\w.-]+:)?series)[\s>]|</(?:[\w.-]+:)?series\s*>")
+HEADER_END_PATTERN = re.compile(rb"</(?:[\w.-]+:)?header\s*>")
+TIME_ZONE_PATTERN = re.compile(rb"<(?:[\w.-]+:)?timeZone\s*>\s*([^<\s]*)\s*<")
+EVENT_PATTERN = re.compile(rb"<(?:[\w.-]+:)?event[\s/>]")
+
+INDEX_COLUMNS = [
+    "id",
+    "location_id",
+    "parameter_id",
+    "qualifier_ids",
+    "start_date",
+    "end_date",
+    "byte_start",
+    "byte_stop",
+    "bin_start",
+    "bin_stop",
+]
+
+
+def find_root_tag(data) -> tuple[bytes, bytes]:
+    """Find the opening and closing tag of the <TimeSeries> root in raw xml bytes.
+    The opening tag carries the namespace declarations, so it can be used to
+    parse fragments of the document on their own.
+    """
+    match = ROOT_PATTERN.search(data)
+    if match is None:
+        raise ValueError("No <TimeSeries> root found in xml")
+    return match.group(0), b"</" + match.group(1) + b">"
+
+
+def find_time_zone(data) -> float:
+    """PI <timeZone> of the document in raw xml bytes, 0.0 (UTC) when it is not set.
+    Only the part before the first series is searched.
+    """
+    first_series = SERIES_PATTERN.search(data)
+    match = TIME_ZONE_PATTERN.search(data, 0, len(data) if first_series is None else first_series.start())
+    if match is None:
+        return 0.0
+    return float(match.group(1))
+
+
+def scan_series_boundaries(data, pos: int = 0, endpos: int = None) -> np.ndarray:
+    """Byte offsets of all <series> elements in raw xml bytes (or mmap).
+
+    Returns
+    -------
+    np.ndarray with shape (n, 2): start of the opening tag and end of the closing tag of every series.
+    """
+    if endpos is None:
+        endpos = len(data)
+
+    boundaries = []
+    start = None
+    for match in SERIES_PATTERN.finditer(data, pos, endpos):
+        if match.group(1) is not None:
+            start = match.start()
+        elif start is not None:
+            boundaries.append((start, match.end()))
+            start = None
+    return np.array(boundaries, dtype=np.int64).reshape(-1, 2)
+
+
+def parse_fragment(fragment: bytes, root_tag: tuple[bytes, bytes]) -> etree._Element:
+    """Parse series from a part of the xml, wrapped in the root so the namespaces resolve.
+    Returns the root element with the parsed series as children.
+    """
+    return etree.fromstring(root_tag[0] + fragment + root_tag[1], parser=etree.XMLParser(remove_blank_text=True))
+
+
+class XmlIndex(hrt.File):
+    """Sidecar index of a PI-XML, stored next to the xml as <name>.xml.idx
+
+    The index has a row per <series> with the byte offsets of the series in the xml,
+    the main header fields and, for binary files, the offsets in the .bin.
+    The header dates are in the PI timeZone of the xml, which is stored with the index.
+    It is only valid for the size and mtime of the xml it was built for.
+    """
+
+    def __init__(self, xml_path):
+        self.xml = XmlFile(xml_path=xml_path)
+        super().__init__(base=f"{self.xml.base}.idx")
+
+        # Filled at runtime.
+        self.df = None
+        self.root_tag = None
+        self.time_zone = 0.0
+
+    @classmethod
+    def from_xml_file(cls, xml_path, rebuild: bool = False):
+        """Load the index of an xml. It is (re)build and written when it does not exist,
+        is outdated or rebuild=True.
+        """
+        xml_index = cls(xml_path=xml_path)
+        if rebuild or not xml_index.read():
+            xml_index.build()
+            xml_index.write()
+        return xml_index
+
+    @property
+    def xml_key(self) -> dict:
+        """Size and mtime of the xml, an index with another key is outdated"""
+        stat = self.xml.path.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def build(self):
+        """Scan the xml for series and parse only their headers."""
+        rows = []
+        timesteps = []
+        is_binary = self.xml.is_binary  # checks the files, once and not per serie
+        with open(self.xml.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self.root_tag = find_root_tag(data)
+            self.time_zone = find_time_zone(data)
+            for byte_start, byte_stop in scan_series_boundaries(data):
+                # Parse the series up to and including the header.
+                header_end = HEADER_END_PATTERN.search(data, byte_start, byte_stop)
+                series_tag = SERIES_PATTERN.match(data, byte_start).group(1)
+                fragment = data[byte_start : header_end.end()] + b"</" + series_tag + b">"
+                header_element = parse_fragment(fragment, self.root_tag)[0].find("{*}header")
+                header = XmlHeader.from_pi_header_element(header_element)
+
+                rows.append(
+                    [
+                        header.id,
+                        header.location_id,
+                        header.parameter_id,
+                        ",".join(header.qualifier_ids or []),
+                        None if header.start_date is None else f"{header.start_date.date}T{header.start_date.time}",
+                        None if header.end_date is None else f"{header.end_date.date}T{header.end_date.time}",
+                        byte_start,
+                        byte_stop,
+                    ]
+                )
+                if is_binary:
+                    bin_size = header.timesteps
+                    if bin_size is None:
+                        # Nonequidistant, one value per event.
+                        bin_size = sum(1 for _ in EVENT_PATTERN.finditer(data, header_end.end(), byte_stop))
+                    timesteps.append(bin_size)
+
+        self.df = pd.DataFrame(rows, columns=INDEX_COLUMNS[:-2])
+        offsets = bin_offsets(timesteps) if is_binary else np.zeros(len(rows) + 1, dtype=np.int64)
+        self.df["bin_start"] = offsets[:-1]
+        self.df["bin_stop"] = offsets[1:]
+        return self.df
+
+    def read(self) -> bool:
+        """Read index from file. Returns False when there is no valid index for the xml."""
+        if not self.exists():
+            return False
+
+        with open(self.path) as f:
+            index = json.load(f)
+        if index["xml"] != self.xml_key or "time_zone" not in index:
+            return False
+
+        self.root_tag = (index["root_tag"][0].encode(), index["root_tag"][1].encode())
+        self.time_zone = index["time_zone"]
+        self.df = pd.DataFrame(index["columns"], columns=INDEX_COLUMNS)
+        return True
+
+    def write(self):
+        """Write index as json, stored column-wise to keep it compact."""
+        index = {
+            "xml": self.xml_key,
+            "root_tag": [self.root_tag[0].decode(), self.root_tag[1].decode()],
+            "time_zone": self.time_zone,
+            "columns": {k: v.tolist() for k, v in self.df.items()},
+        }
+        with open(self.path, "w") as f:
+            json.dump(index, f)
+
+    def select(self, location_id=None, parameter_id=None) -> pd.DataFrame:
+        """Rows of the index that match the location_id and parameter_id (str or list)."""
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, selection in (("location_id", location_id), ("parameter_id", parameter_id)):
+            if selection is not None:
+                if isinstance(selection, str):
+                    selection = [selection]
+                mask &= self.df[column].isin(selection).to_numpy()
+        return self.df[mask]
@@ -0,0 +1,215 @@
+# %%
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+
+import numpy as np
+import pandas as pd
+
+from hhnk_fewspy.xml_classes import XmlDate, XmlFile, XmlFilter, XmlHeader, XmlTimeSeries, XmlTimeStep
+from hhnk_fewspy.xml_index import find_root_tag, find_time_zone, parse_fragment, scan_series_boundaries
+
+CHUNKS_PER_WORKER = 4  # more chunks than workers, so a slow chunk does not hold up the rest
+
+ALIGNMENT = 8  # bytes, keeps the int64/float64 views in the buffer aligned
+
+
+def pack_headers(headers: list) -> dict:
+    """Header fields as columns of plain values, the timestep and dates as tuples.
+    A few lists of str and numbers pickle a lot faster than a dataclass object per serie.
+    """
+    columns = {}
+    for field in fields(XmlHeader):
+        values = [getattr(header, field.name) for header in headers]
+        if field.name == "time_step":
+            values = [None if v is None else (v.unit, v.multiplier, v.divider) for v in values]
+        elif field.name in ("start_date", "end_date"):
+            values = [None if v is None else (v.key, v.date, v.time) for v in values]
+        columns[field.name] = values
+    return columns
+
+
+def unpack_headers(columns: dict) -> list:
+    """Create XmlHeader objects from pack_headers output.
+    Equal timesteps and dates are created once and shared by the headers.
+    """
+    columns = dict(columns)
+    time_steps = {v: XmlTimeStep(*v) for v in set(columns["time_step"]) if v is not None}
+    columns["time_step"] = [time_steps.get(v) for v in columns["time_step"]]
+    for key in ("start_date", "end_date"):
+        dates = {v: XmlDate(*v) for v in set(columns[key]) if v is not None}
+        columns[key] = [dates.get(v) for v in columns[key]]
+    # The columns are in the order of the fields.
+    return [XmlHeader(*values) for values in zip(*columns.values())]
+
+
+def pack_series(series: list) -> tuple:
+    """Pack the columnar data of series into one contiguous buffer.
+
+    Sending the buffer to another process costs a single copy, unlike
+    pickling a DataFrame or XmlTimeSeries object per series. The headers
+    are sent as columns, see pack_headers.
+
+    Returns
+    -------
+    buffer (np.ndarray): uint8 buffer with the data, index and event columns of all series
+    layout (tuple): (header columns, list of (is_binary, tz, columns) per serie)
+        columns is {column: (dtype, offset, length, categories)}, categories is None for
+        numeric columns, categoricals are stored as codes.
+    """
+    layout = []
+    columns = []
+    nbytes = 0
+    for serie in series:
+        serie_columns = {"data": np.ascontiguousarray(serie.data)}
+        if serie.index is not None:
+            serie_columns["index"] = serie.index.as_unit("ns").asi8
+        serie_columns.update(serie.event_columns or {})
+
+        serie_layout = {}
+        for key, values in serie_columns.items():
+            categories = None
+            if isinstance(values, pd.Categorical):
+                categories = values.categories.tolist()
+                values = values.codes
+            serie_layout[key] = (values.dtype.str, nbytes, len(values), categories)
+            columns.append((nbytes, values))
+            nbytes += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+        layout.append((serie.is_binary, serie.tz, serie_layout))
+
+    buffer = np.empty(nbytes, dtype=np.uint8)
+    for offset, values in columns:
+        buffer[offset : offset + values.nbytes] = values.view(np.uint8)
+    return buffer, (pack_headers([serie.header for serie in series]), layout)
+
+
+def unpack_series(buffer: np.ndarray, layout: tuple) -> list:
+    """Create XmlTimeSeries from pack_series output. The columns are views on the buffer."""
+    header_columns, layout = layout
+    series = []
+    for header, (is_binary, tz, serie_layout) in zip(unpack_headers(header_columns), layout):
+        columns = {}
+        for key, (dtype, offset, length, categories) in serie_layout.items():
+            dtype = np.dtype(dtype)
+            columns[key] = buffer[offset : offset + length * dtype.itemsize].view(dtype)
+            if categories is not None:
+                columns[key] = pd.Categorical.from_codes(columns[key], categories=categories)
+
+        data = columns.pop("data")
+        index = columns.pop("index", None)
+        if index is not None:
+            index = pd.DatetimeIndex(index.view("datetime64[ns]"))
+        series.append(
+            XmlTimeSeries(
+                header=header, data=data, is_binary=is_binary, index=index, event_columns=columns or None, tz=tz
+            )
+        )
+    return series
+
+
+def read_xml_packed(xml_path, tz="UTC", dtype=None) -> tuple:
+    """Read xml in a worker process and return it packed, see pack_series."""
+    return pack_series(list(XmlFile.iter_series(xml_path, tz=tz, dtype=dtype)))
+
+
+def read_xml_files(xml_paths: list, workers: int = None, tz="UTC", dtype=None) -> list:
+    """Read xml files in parallel worker processes.
+
+    Returns list with the XmlTimeSeries of each file, in the order of xml_paths.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    workers = min(workers, len(xml_paths))
+
+    if workers <= 1:
+        return [list(XmlFile.iter_series(xml_path, tz=tz, dtype=dtype)) for xml_path in xml_paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        packed_files = executor.map(read_xml_packed, xml_paths, [tz] * len(xml_paths), [dtype] * len(xml_paths))
+        return [unpack_series(*packed) for packed in packed_files]
+
+
+def split_series_chunks(boundaries: np.ndarray, n_chunks: int) -> list:
+    """Split series into consecutive chunks with about the same number of bytes.
+
+    boundaries (np.ndarray): (n, 2) byte offsets of the series, see scan_series_boundaries
+    Returns list of (byte_start, byte_stop) per chunk, in the order of the file.
+    """
+    if len(boundaries) == 0:
+        return []
+    n_chunks = min(n_chunks, len(boundaries))
+
+    # A chunk ends with the serie that passes an equal share of the cumulative bytes, the
+    # next chunk starts after it. A serie larger than a share also starts its own chunk.
+    serie_sizes = boundaries[:, 1] - boundaries[:, 0]
+    sizes = np.cumsum(serie_sizes)
+    targets = sizes[-1] * np.arange(1, n_chunks) / n_chunks
+    crossing = np.searchsorted(sizes, targets, side="left")
+    large = crossing[serie_sizes[crossing] > sizes[-1] / n_chunks]
+    firsts = np.unique(np.concatenate([[0], large, crossing + 1]))
+    firsts = firsts[firsts < len(boundaries)]
+
+    lasts = np.append(firsts[1:], len(boundaries)) - 1
+    return list(zip(boundaries[firsts, 0].tolist(), boundaries[lasts, 1].tolist()))
+
+
+def read_xml_chunk_packed(
+    xml_path,
+    root_tag: tuple,
+    byte_start: int,
+    byte_stop: int,
+    xml_filter: XmlFilter,
+    time_zone: float,
+    tz="UTC",
+    dtype=None,
+):
+    """Parse the series between two byte offsets of an xml in a worker process.
+    Returns the series packed, see pack_series.
+    """
+    with open(xml_path, "rb") as f:
+        f.seek(byte_start)
+        root = parse_fragment(f.read(byte_stop - byte_start), root_tag)
+
+    series = []
+    for series_element in root:
+        header = XmlHeader.from_pi_header_element(series_element.find("{*}header"), time_zone=time_zone)
+        if xml_filter.select_header(header):
+            serie = XmlTimeSeries.from_pi_series_element(
+                series_element, header=header, xml_filter=xml_filter, tz=tz, dtype=dtype
+            )
+            if len(serie.data) > 0 or not xml_filter.has_time_window:
+                series.append(serie)
+        series_element.clear()
+    return pack_series(series)
+
+
+def read_xml_file_chunks(xml_path, xml_filter: XmlFilter, workers: int = None, tz="UTC", dtype=None) -> list:
+    """Parse one (non-binary) xml in parallel worker processes.
+
+    The file is scanned for the byte boundaries of <series>, split in chunks
+    with about the same size and every chunk is parsed separately, wrapped in
+    the root tag of the file so the namespaces resolve.
+
+    Returns list of XmlTimeSeries in the order of the file.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+
+    with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        root_tag = find_root_tag(data)
+        time_zone = find_time_zone(data)
+        chunks = split_series_chunks(scan_series_boundaries(data), n_chunks=workers * CHUNKS_PER_WORKER)
+    xml_filter = xml_filter.in_time_zone(time_zone)
+
+    series = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                read_xml_chunk_packed, xml_path, root_tag, byte_start, byte_stop, xml_filter, time_zone, tz, dtype
+            )
+            for byte_start, byte_stop in chunks
+        ]
+        for future in futures:
+            series += unpack_series(*future.result())
+    return series
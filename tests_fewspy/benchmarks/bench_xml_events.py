@@ -0,0 +1,48 @@
+# %%
+"""Benchmark of the event strings that XmlFile.write puts in a PI-XML.
+
+Compares format_events (vectorised dates, times and values joined as one byte
+matrix) with the previous XmlTimeSeries.make_events, which built a template
+with two strftime calls per event through pd.Series.apply and filled it with
+str.format(*values).
+
+Run with: python tests_fewspy/benchmarks/bench_xml_events.py
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from hhnk_fewspy.xml_classes import TAB, format_events
+
+
+def make_events_apply(index: pd.DatetimeIndex, values: np.ndarray) -> str:
+    """Previous implementation of XmlTimeSeries.make_events"""
+    eventstr_base = "".join(
+        pd.Series(index).apply(
+            lambda x: (
+                f'{TAB * 2}<event date="{x.strftime("%Y-%m-%d")}" time="{x.strftime("%H:%M:%S")}" value="{{}}"/>\n'
+            )
+        )
+    )
+    return eventstr_base.format(*values)
+
+
+if __name__ == "__main__":
+    for n_events in [10_000, 1_000_000]:
+        index = pd.date_range("2021-06-22", periods=n_events, freq="15min")
+        values = np.random.default_rng(0).normal(size=n_events).round(3)
+
+        start = time.perf_counter()
+        events_old = make_events_apply(index, values)
+        t_old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        events_new = format_events(index, values).decode()
+        t_new = time.perf_counter() - start
+
+        assert events_old == events_new
+        print(
+            f"{n_events} events: apply + format {t_old:.3f}s, format_events {t_new:.3f}s, speedup {t_old / t_new:.0f}x"
+        )
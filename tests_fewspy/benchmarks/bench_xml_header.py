@@ -0,0 +1,77 @@
+# %%
+"""Micro-benchmark of XmlHeader.from_pi_header_element.
+
+Compares the table driven header parsing with the previous implementation
+that built a metadata dict and converted every tag with camel_to_snake_case.
+
+Run with: python tests_fewspy/benchmarks/bench_xml_header.py
+"""
+
+import time
+
+from lxml import etree
+
+from hhnk_fewspy.xml_classes import DATETIME_KEYS, FLOAT_KEYS, XmlDate, XmlHeader, camel_to_snake_case
+
+HEADER = """<header xmlns="http://www.wldelft.nl/fews/PI">
+    <type>instantaneous</type>
+    <moduleInstanceId>ImportTelemetrie</moduleInstanceId>
+    <locationId>union_{}</locationId>
+    <parameterId>H.meting</parameterId>
+    <qualifierId>validated</qualifierId>
+    <timeStep unit="second" multiplier="900"/>
+    <startDate date="2021-06-22" time="06:00:00"/>
+    <endDate date="2021-06-22" time="07:00:00"/>
+    <missVal>-999.0</missVal>
+    <stationName>union_{}</stationName>
+    <lat>52.6</lat>
+    <lon>4.8</lon>
+    <x>115000.0</x>
+    <y>520000.0</y>
+    <z>0.0</z>
+    <units>m</units>
+</header>"""
+
+
+def from_pi_header_element_dict(subchild):
+    """Previous implementation of XmlHeader.from_pi_header_element."""
+    metadata = {}
+    for item in subchild.getchildren():
+        key = item.tag.split("}")[-1]
+        item_keys = item.keys()
+        if len(item_keys) == 0:
+            metadata[key] = item.text
+        else:
+            metadata[key] = {}
+            for item_key, item_value in zip(item_keys, item.values()):
+                metadata[key][item_key] = item_value
+
+    def _convert_kv(key: str, value):
+        key = camel_to_snake_case(key)
+        if key in DATETIME_KEYS:
+            value = XmlDate.from_pi_header(key, value)
+        if key in FLOAT_KEYS:
+            value = float(value)
+        return key, value
+
+    args = (_convert_kv(k, v) for k, v in metadata.items())
+    return XmlHeader(**{i[0]: i[1] for i in args if i[0] in XmlHeader.__dataclass_fields__.keys()})
+
+
+def timeit(func, elements, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for element in elements:
+            func(element)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    n_series = 100_000
+    elements = [etree.fromstring(HEADER.format(i, i)) for i in range(n_series)]
+
+    t_old = timeit(from_pi_header_element_dict, elements)
+    t_new = timeit(XmlHeader.from_pi_header_element, elements)
+    print(f"{n_series} headers: metadata dict {t_old:.3f}s, tag table {t_new:.3f}s, speedup {t_old / t_new:.1f}x")
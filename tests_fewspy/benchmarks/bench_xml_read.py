@@ -0,0 +1,95 @@
+# %%
+"""Benchmark reading non-binary PI-XML.
+
+Compares XmlFile.from_xml_file with the previous objectify based reader
+on a scaled up version of tests_fewspy/data/normal_test_series.xml.
+
+Run with: python tests_fewspy/benchmarks/bench_xml_read.py
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from lxml import objectify
+
+from hhnk_fewspy.xml_classes import XmlFile
+
+HEAD = """<?xml version="1.0"?>
+<TimeSeries xmlns="http://www.wldelft.nl/fews/PI" version="1.22">
+    <timeZone>0.0</timeZone>
+"""
+SERIES_HEADER = """    <series>
+        <header>
+            <type>instantaneous</type>
+            <locationId>loc_{}</locationId>
+            <parameterId>H.meting</parameterId>
+            <timeStep unit="second" multiplier="900" />
+            <missVal>-999.0</missVal>
+        </header>
+"""
+
+
+def make_xml(path, n_series: int, n_events: int):
+    """Write a text PI-XML with n_series series of n_events events each."""
+    index = pd.date_range("2021-06-22", periods=n_events, freq="15min")
+    dates = index.strftime("%Y-%m-%d")
+    times = index.strftime("%H:%M:%S")
+    values = np.random.default_rng(0).normal(size=n_events)
+    events = "".join(
+        f'        <event date="{d}" time="{t}" value="{v}" flag="0" />\n' for d, t, v in zip(dates, times, values)
+    )
+    with open(path, "w") as f:
+        f.write(HEAD)
+        for i in range(n_series):
+            f.write(SERIES_HEADER.format(i))
+            f.write(events)
+            f.write("    </series>\n")
+        f.write("</TimeSeries>")
+
+
+def read_objectify(path) -> list:
+    """Previous reader: objectify tree, list of event attributes and untyped to_datetime."""
+    root = objectify.parse(str(path)).getroot()
+    dfs = []
+    for child in root.getchildren():
+        if not child.tag.endswith("series"):
+            continue
+        data = [subchild.values() for subchild in child.getchildren() if not subchild.tag.endswith("header")]
+        df = pd.DataFrame(data)
+        df.set_index(pd.to_datetime(df[0] + "T" + df[1]), inplace=True)
+        df.drop([0, 1], axis=1, inplace=True)
+        df.rename({2: "value"}, axis=1, inplace=True)
+        df["value"] = df["value"].astype(float)
+        dfs.append(df)
+    return dfs
+
+
+def read_xml_file(path) -> list:
+    return [serie.df for serie in XmlFile.from_xml_file(path).series]
+
+
+def timeit(func, path, repeat: int = 3) -> float:
+    return min(_time_once(func, path) for _ in range(repeat))
+
+
+def _time_once(func, path) -> float:
+    start = time.perf_counter()
+    func(path)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_series, n_events in [(100, 1000), (20, 50_000)]:
+            path = Path(tmpdir) / f"bench_{n_series}_{n_events}.xml"
+            make_xml(path, n_series=n_series, n_events=n_events)
+
+            t_old = timeit(read_objectify, path)
+            t_new = timeit(read_xml_file, path)
+            print(
+                f"{n_series} series x {n_events} events: objectify {t_old:.3f}s, "
+                f"XmlFile {t_new:.3f}s, speedup {t_old / t_new:.1f}x"
+            )
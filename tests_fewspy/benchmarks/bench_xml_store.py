@@ -0,0 +1,80 @@
+# %%
+"""Benchmark of the SeriesStore behind XmlFile.series.
+
+Compares the retained memory and a bulk operation (mean of every serie) of
+series that share a time axis, stored as XmlTimeSeries objects in a pd.Series
+(previous XmlFile.series) and as one TimeBlock in a SeriesStore.
+
+Run with: python tests_fewspy/benchmarks/bench_xml_store.py
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from hhnk_fewspy.xml_classes import SeriesStore, XmlDate, XmlHeader, XmlTimeSeries, XmlTimeStep
+
+
+def make_series(n_series: int, n_timesteps: int) -> list:
+    time_step = XmlTimeStep(unit="minute", multiplier=15)
+    start = pd.Timestamp("2021-06-22")
+    end = start + (n_timesteps - 1) * pd.Timedelta(minutes=15)
+    values = np.random.default_rng(0).random((n_series, n_timesteps)).astype(np.float32)
+    return [
+        XmlTimeSeries(
+            header=XmlHeader(
+                location_id=f"loc_{i}",
+                parameter_id="H.meting",
+                time_step=time_step,
+                start_date=XmlDate.from_datetime("start_date", start),
+                end_date=XmlDate.from_datetime("end_date", end),
+            ),
+            data=values[i],
+            is_binary=True,
+        )
+        for i in range(n_series)
+    ]
+
+
+def retained(func) -> tuple:
+    """Run func, returns the result and the memory it allocated that is still in use"""
+    tracemalloc.start()
+    result = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def fill_pd_series(series: list) -> pd.Series:
+    collection = pd.Series({serie.id: serie for serie in series})
+    for serie in series:
+        serie.df  # noqa: B018, every serie owned its df after to_df
+    return collection
+
+
+def fill_store(series: list) -> SeriesStore:
+    store = SeriesStore()
+    for serie in series:
+        store.add(serie)
+    return store
+
+
+if __name__ == "__main__":
+    n_series, n_timesteps = 50_000, 96
+
+    collection, mem_old = retained(lambda: fill_pd_series(make_series(n_series, n_timesteps)))
+    store, mem_new = retained(lambda: fill_store(make_series(n_series, n_timesteps)))
+    print(f"{n_series} series, retained memory: pd.Series {mem_old / 1e6:.0f}MB, SeriesStore {mem_new / 1e6:.0f}MB")
+
+    start = time.perf_counter()
+    means_old = np.array([serie.df["value"].mean() for serie in collection])
+    t_old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    means_new = np.concatenate([block.data.mean(axis=1) for block in store.time_blocks])
+    t_new = time.perf_counter() - start
+
+    assert np.allclose(means_old, means_new)
+    print(f"mean per serie: pd.Series {t_old:.3f}s, SeriesStore {t_new:.4f}s, speedup {t_old / t_new:.0f}x")
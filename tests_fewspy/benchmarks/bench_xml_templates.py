@@ -0,0 +1,37 @@
+# %%
+"""Benchmark of writing the columns of a df, which all share one time axis.
+
+Compares formatting the dates and times of the events for every serie with
+sharing them through EventTemplates, like write_series does.
+
+Run with: python tests_fewspy/benchmarks/bench_xml_templates.py
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from hhnk_fewspy.xml_classes import EventTemplates, XmlFile
+
+if __name__ == "__main__":
+    for n_columns, n_events in [(2_000, 1_000), (200, 100_000)]:
+        index = pd.date_range("2021-06-22", periods=n_events, freq="15min", tz="UTC")
+        values = np.random.default_rng(0).normal(size=(n_events, n_columns)).round(3)
+        df = pd.DataFrame(values, index=index, columns=[f"loc_{i}" for i in range(n_columns)])
+        xml_file = XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=-999.0)
+
+        start = time.perf_counter()
+        events_old = [b"".join(serie.iter_xml()) for serie in xml_file.series]
+        t_old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        templates = EventTemplates()
+        events_new = [b"".join(serie.iter_xml(templates=templates)) for serie in xml_file.series]
+        t_new = time.perf_counter() - start
+
+        assert events_old == events_new
+        print(
+            f"{n_columns} columns x {n_events} events: per serie {t_old:.2f}s, "
+            f"shared templates {t_new:.2f}s, speedup {t_old / t_new:.1f}x"
+        )
@@ -0,0 +1,73 @@
+# %%
+"""Benchmark of XmlFile.to_df.
+
+Compares the block assembly of to_df with the previous implementation, which
+concatenated a renamed DataFrame per serie and replaced the missVal per column.
+Half of the series has a 15 minute and half a 1 hour timestep, so the result
+is aligned on the union of both indexes.
+
+Run with: python tests_fewspy/benchmarks/bench_xml_to_df.py
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from hhnk_fewspy.xml_classes import XmlDate, XmlFile, XmlHeader, XmlTimeSeries, XmlTimeStep
+
+
+def make_xml_file(n_series: int, n_days: int = 7) -> XmlFile:
+    start = pd.Timestamp("2021-06-22")
+    end = start + pd.Timedelta(days=n_days) - pd.Timedelta(hours=1)
+    rng = np.random.default_rng(0)
+
+    xml_file = XmlFile(xml_path=None)
+    for i in range(n_series):
+        time_step = XmlTimeStep(unit="minute", multiplier=15) if i % 2 else XmlTimeStep(unit="hour")
+        header = XmlHeader(
+            location_id=f"loc_{i}",
+            parameter_id="H.meting",
+            time_step=time_step,
+            start_date=XmlDate.from_datetime("start_date", start),
+            end_date=XmlDate.from_datetime("end_date", end),
+            miss_val=-999.0,
+        )
+        values = rng.random(time_step.count(start, end)).astype(np.float32)
+        values[::10] = -999.0
+        xml_file.add_time_series(XmlTimeSeries(header=header, data=values, is_binary=True))
+    return xml_file
+
+
+def to_df_concat(xml_file: XmlFile) -> pd.DataFrame:
+    """Previous implementation of XmlFile.to_df(miss_val_to_nan=True)"""
+    df_ts = pd.concat([v.df["value"].rename(k) for k, v in xml_file.series.items()], axis=1, sort=True)
+    miss_series = pd.Series([v.header.miss_val for k, v in xml_file.series.items()])
+    miss_series.index = xml_file.series.keys()
+    df_ts.replace(miss_series, np.nan, inplace=True)
+    return df_ts
+
+
+def measure(func, xml_file: XmlFile) -> tuple:
+    """Run func, returns the result, time and peak memory"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(xml_file)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+if __name__ == "__main__":
+    n_series = 5_000
+    xml_file = make_xml_file(n_series)
+
+    df_old, t_old, mem_old = measure(to_df_concat, xml_file)
+    df_new, t_new, mem_new = measure(lambda x: x.to_df(miss_val_to_nan=True), xml_file)
+
+    pd.testing.assert_frame_equal(df_old, df_new, check_freq=False)
+    print(f"to_df of {n_series} series {df_new.shape}")
+    print(f"  concat + replace: {t_old:.2f}s, peak {mem_old / 1e6:.0f}MB")
+    print(f"  block assembly:   {t_new:.2f}s, peak {mem_new / 1e6:.0f}MB, speedup {t_old / t_new:.0f}x")
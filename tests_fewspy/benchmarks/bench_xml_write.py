@@ -0,0 +1,79 @@
+# %%
+"""Benchmark of the peak memory of XmlFile.write.
+
+Compares writing the events of every serie in chunks (XmlTimeSeries.iter_xml)
+with the previous writer, which built the whole <series> string of a serie
+(and cached its event strings) before writing it. Binary series are written,
+so the values are a memory map and the peak is the memory of the writer.
+
+Run with: python tests_fewspy/benchmarks/bench_xml_write.py
+"""
+
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from hhnk_fewspy.xml_classes import XmlDate, XmlFile, XmlHeader, XmlTimeSeries, XmlTimeStep
+
+
+def make_xml_file(n_series: int, n_events: int) -> XmlFile:
+    time_step = XmlTimeStep(unit="minute", multiplier=15)
+    start = pd.Timestamp("2021-06-22")
+    end = start + (n_events - 1) * pd.Timedelta(minutes=15)
+    values = np.random.default_rng(0).normal(size=(n_series, n_events)).round(3).astype(np.float32)
+
+    xml_file = XmlFile(xml_path=None)
+    for i in range(n_series):
+        header = XmlHeader(
+            location_id=f"loc_{i}",
+            parameter_id="H.meting",
+            time_step=time_step,
+            start_date=XmlDate.from_datetime("start_date", start),
+            end_date=XmlDate.from_datetime("end_date", end),
+        )
+        xml_file.add_time_series(XmlTimeSeries(header=header, data=values[i], is_binary=True))
+    return xml_file
+
+
+def write_whole_series(xml_file: XmlFile, output_path: Path):
+    """Previous XmlFile.write, one str per serie"""
+    with open(output_path, "w") as f:
+        f.write(xml_file.head)
+        f.write("<timeZone>0.0</timeZone>\n")
+        for serie in xml_file.series:
+            f.write(serie.to_str())
+        f.write("</TimeSeries>")
+
+
+def measure(func) -> tuple:
+    """Run func, returns the time and peak memory"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_series, n_events in [(4, 250_000), (4, 1_000_000), (4, 4_000_000)]:
+            xml_file = make_xml_file(n_series, n_events)
+            old_path, new_path = Path(tmpdir) / "old.xml", Path(tmpdir) / "new.xml"
+
+            t_old, mem_old = measure(lambda: write_whole_series(xml_file, old_path))
+            t_new, mem_new = measure(lambda: xml_file.write(new_path))
+
+            assert old_path.read_bytes() == new_path.read_bytes()
+            print(
+                f"{n_series} series x {n_events} events ({new_path.stat().st_size / 1e6:.0f}MB): "
+                f"whole series {t_old:.2f}s, peak {mem_old / 1e6:.0f}MB, "
+                f"chunked {t_new:.2f}s, peak {mem_new / 1e6:.0f}MB"
+            )
+            old_path.unlink()
+            new_path.unlink()
@@ -5,11 +5,16 @@ from tests_fewspy.config import FOLDER_DATA
 
 
 def test_xml_to_dict():
-    xml_functions.xml_to_dict(xml_path=FOLDER_DATA.bin_test_series.base, binary=True)
+    series = xml_functions.xml_to_dict(xml_path=FOLDER_DATA.bin_test_series.base, binary=True)
+
+    assert len(series) == 708
+    assert isinstance(series["union_8020 AE2"]["H.meting"], xml_classes.XmlTimeSeries)
 
 
 def test_xml():
-    xml_functions.xml_to_df(xml_path=FOLDER_DATA.bin_test_series.base, binary=True, parameter="")
+    df = xml_functions.xml_to_df(xml_path=FOLDER_DATA.bin_test_series.base, binary=True, parameter="H.meting")
+
+    assert df.shape == (5, 708)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,42 @@
 # %%
-from hhnk_fewspy.xml_classes import XmlFile, XmlHeader
+import datetime
+import gzip
+import shutil
+import zipfile
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from lxml import etree
+
+from hhnk_fewspy.xml_classes import EventTemplates, XmlFile, XmlHeader, XmlTimeStep
+from hhnk_fewspy.xml_parallel import split_series_chunks
+
+BIN_XML = """<?xml version="1.0" ?>
+<TimeSeries xmlns="http://www.wldelft.nl/fews/PI" version="1.22">
+    <timeZone>0.0</timeZone>
+{}</TimeSeries>"""
+
+BIN_SERIES = """    <series>
+        <header>
+            <type>instantaneous</type>
+            <locationId>{location_id}</locationId>
+            <parameterId>H.meting</parameterId>
+            <timeStep unit="{unit}" multiplier="{multiplier}"/>
+            <startDate date="2021-06-22" time="{start}"/>
+            <endDate date="2021-06-22" time="{end}"/>
+            <missVal>-999.0</missVal>
+        </header>
+    </series>
+"""
+
+
+def write_bin_xml(path, series: list, values: np.ndarray):
+    """Write header-only xml with a .bin next to it."""
+    path.write_text(BIN_XML.format("".join(BIN_SERIES.format(**s) for s in series)))
+    values.astype(np.float32).tofile(path.with_suffix(".bin"))
 
 
 def test_xml_header():
@@ -17,12 +54,135 @@ def test_xml_header():
     assert xml_header.location_id == "union_5803-15"
 
 
+def test_xml_header_from_element():
+    """Test if we can parse a header element, including repeated qualifiers"""
+    header_str = """<header xmlns="http://www.wldelft.nl/fews/PI">
+        <type>instantaneous</type>
+        <locationId>union_5803-15</locationId>
+        <parameterId>H.meting</parameterId>
+        <qualifierId>a</qualifierId>
+        <qualifierId>b</qualifierId>
+        <timeStep unit="second" multiplier="900"/>
+        <startDate date="2021-06-22" time="06:00:00"/>
+        <missVal>-999.0</missVal>
+        <creationDate>2021-06-22</creationDate>
+    </header>"""
+    xml_header = XmlHeader.from_pi_header_element(etree.fromstring(header_str))
+    xml_header2 = XmlHeader.from_pi_header_element(etree.fromstring(header_str))
+
+    assert xml_header.qualifier_ids == ["a", "b"]
+    assert xml_header.miss_val == -999.0
+    assert xml_header.start_date.date_time == datetime.datetime(2021, 6, 22, 6)
+    assert xml_header.id == "union_5803-15__H.meting__900second"
+    assert xml_header.time_step is xml_header2.time_step
+
+
+def test_xml_time_step():
+    """Test index and number of timesteps for calendar units and dividers"""
+    day = XmlTimeStep(unit="day", multiplier=2)
+    assert day.count("2021-01-01", "2021-01-09") == 5
+    assert day.index("2021-01-01", "2021-01-05")[-1] == np.datetime64("2021-01-05")
+
+    month = XmlTimeStep.from_pi_header({"unit": "month", "multiplier": "1"})
+    index = month.index("2021-01-31 06:00", "2021-12-31 06:00")
+    assert len(index) == month.count("2021-01-31 06:00", "2021-12-31 06:00") == 12
+    # Day 31 is clipped to the last day of shorter months, every month is in the index once.
+    expected = pd.DatetimeIndex([pd.Timestamp("2021-01-31 06:00") + pd.DateOffset(months=n) for n in range(12)])
+    assert index.equals(expected)
+    assert index[1] == np.datetime64("2021-02-28T06:00")
+    assert month.count("2021-01-31", "2021-04-29") == 3  # the step on 30 april is after end
+    assert month.window("2021-01-01", "2021-12-01", "2021-02-15", "2021-05-01") == slice(2, 5)
+    assert month.index("2021-01-31 06:00", "2021-12-31 06:00", positions=slice(2, 5)).equals(index[2:5])
+
+    divided = XmlTimeStep(unit="minute", multiplier=1, divider=4)
+    assert divided.nanoseconds == 15 * 10**9
+    assert str(divided) == "1minute/4"
+    assert divided.xml_str() == '<timeStep unit="minute" multiplier="1" divider="4"/>'
+    assert XmlTimeStep.from_index(index[:1].append(index[:1] + np.timedelta64(1, "h"))).unit == "hour"
+    assert not XmlTimeStep.from_index(index).is_equidistant
+
+
+@pytest.mark.parametrize(
+    "index",
+    [
+        pd.date_range("2021-01-02", periods=3, freq="-1h"),  # descending
+        pd.DatetimeIndex(["2021-01-01"] * 3),  # duplicate timestamps
+        pd.date_range("2021-01-01", periods=3, freq="500ms"),  # sub-second
+    ],
+)
+def test_xml_file_from_df_nonequidistant(tmp_path, index):
+    """Test if a constant step that is not a positive number of seconds is written as nonequidistant"""
+    assert XmlTimeStep.from_index(index).unit == "nonequidistant"
+
+    df = pd.DataFrame({"loc_1": [1.5, 2.5, 3.5]}, index=index)
+    xml_file = XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=-999.0)
+    assert not xml_file.series.iloc[0].header.is_equidistant
+    xml_file.write(tmp_path / "nonequidistant.xml")
+    df_read = XmlFile.from_xml_file(tmp_path / "nonequidistant.xml").series.iloc[0].df
+    assert df_read.index.tz_localize(None).equals(index)
+    assert df_read["value"].tolist() == [1.5, 2.5, 3.5]
+
+
+def test_xml_file_bin_nonequidistant(tmp_path):
+    """Nonequidistant binary series take their dates from the events and one value per event from the bin"""
+    xml_path = tmp_path / "nonequidistant.xml"
+    series = """    <series>
+        <header>
+            <type>instantaneous</type>
+            <locationId>{}</locationId>
+            <parameterId>H.meting</parameterId>
+            <timeStep unit="nonequidistant"/>
+            <startDate date="2021-06-22" time="00:00:00"/>
+            <endDate date="2021-06-22" time="05:00:00"/>
+            <missVal>-999.0</missVal>
+        </header>
+        <event date="2021-06-22" time="00:00:00"/>
+        <event date="2021-06-22" time="00:10:00"/>
+        <event date="2021-06-22" time="05:00:00"/>
+    </series>
+"""
+    xml_path.write_text(BIN_XML.format(series.format("a") + series.format("b")))
+    np.arange(6, dtype=np.float32).tofile(xml_path.with_suffix(".bin"))
+
+    xml_file = XmlFile.from_xml_file(xml_path)
+    df = xml_file.series["b__H.meting__nonequidistant"].df
+    assert df["value"].tolist() == [3, 4, 5]
+    assert df.index[1] == pd.Timestamp("2021-06-22 00:10", tz="UTC")
+
+    xml_file = XmlFile.from_xml_file(xml_path, end="2021-06-22 01:00")
+    assert xml_file.series["b__H.meting__nonequidistant"].df["value"].tolist() == [3, 4]
+
+    xml_file = XmlFile.read_series(xml_path, location_id="b")
+    assert xml_file.series["b__H.meting__nonequidistant"].df["value"].tolist() == [3, 4, 5]
+
+
+def test_xml_file_without_time_step(tmp_path):
+    """Test if a header without <timeStep> is read like a nonequidistant serie"""
+    events = '        <event date="2021-06-22" time="06:00:00"/>\n        <event date="2021-06-22" time="06:20:00"/>\n'
+    serie = BIN_SERIES.format(location_id="a", unit="", multiplier="", start="06:00:00", end="06:20:00")
+    serie = serie.replace('            <timeStep unit="" multiplier=""/>\n', "")
+    xml_path = tmp_path / "no_time_step.xml"
+    xml_path.write_text(BIN_XML.format(serie.replace("    </series>", f"{events}    </series>")))
+    np.array([1.0, 2.0], dtype=np.float32).tofile(xml_path.with_suffix(".bin"))
+
+    for xml_file in [XmlFile.from_xml_file(xml_path), XmlFile.read_series(xml_path)]:
+        serie = xml_file.series["a__H.meting"]
+        assert serie.timesteps == 2
+        assert serie.df["value"].tolist() == [1.0, 2.0]
+
+    xml_path.with_suffix(".bin").unlink()
+    xml_file = XmlFile.from_xml_file(xml_path)
+    assert xml_file.series["a__H.meting"].timesteps == 2
+
+
 def test_xml_file_bin():
     """Test if we can read binary xml file"""
     xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
 
     df = xml_file.to_df()
     assert int(df.sum().sum()) == -337126
+    # float32 values are written in their shortest repr
+    assert xml_file.series.iloc[0].events.startswith('\t\t<event date="2021-06-22" time="06:00:00" value="-1.106"/>\n')
 
 
 def test_xml_file():
@@ -33,6 +193,591 @@ def test_xml_file():
     assert int(df.sum().sum()) == -11
 
 
+def test_xml_file_events():
+    """Test if events of a normal xml file are read into typed columns"""
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml")
+    df = xml_file.series.iloc[0].df
+
+    assert df.index[1] == pd.Timestamp("2021-06-22 06:15:00", tz="UTC")
+    assert df["value"].dtype == np.float64
+    assert df["flag"].dtype == np.uint8
+    assert "flag" not in xml_file.series.iloc[1].df
+
+
+def test_xml_file_event_attributes_roundtrip(tmp_path):
+    """Test if flag, flagSource, comment and user are read typed and written back"""
+    events = """        <event date="2021-06-22" time="06:00:00" value="1.5" flag="1" flagSource="MAN" user="wvg"/>
+        <event date="2021-06-22" time="06:15:00" value="2.5" flag="0" comment="a &amp; &quot;b&quot;"/>
+        <event date="2021-06-22" time="06:30:00" value="3.5" user="wvg"/>
+"""
+    series = BIN_SERIES.format(location_id="a", unit="minute", multiplier=15, start="06:00:00", end="06:30:00")
+    xml_path = tmp_path / "attributes.xml"
+    xml_path.write_text(BIN_XML.format(series.replace("    </series>", events + "    </series>")))
+
+    df = XmlFile.from_xml_file(xml_path).series.iloc[0].df
+    assert df["flag"].tolist() == [1, 0, 0]
+    assert df["flag"].dtype == np.uint8
+    assert df["user"].dtype == "category"
+    assert df["comment"].tolist()[1] == 'a & "b"'
+    serie = XmlFile.from_xml_file(xml_path).series.iloc[0]
+    assert serie.events.splitlines()[0] == events.splitlines()[0].replace(" " * 8, "\t\t")
+    assert b"".join(serie.iter_xml(chunk_size=2)) == serie.to_str().encode()
+
+    XmlFile.from_xml_file(xml_path).write(tmp_path / "attributes_out.xml")
+    df_out = XmlFile.from_xml_file(tmp_path / "attributes_out.xml").series.iloc[0].df
+    assert df_out.equals(df)
+
+
+def test_xml_time_series_df_setter(tmp_path):
+    """Test if a serie of an XmlFile is written from a replaced df"""
+    for xml_path in [r"data/normal_test_series.xml", r"data/bin_test_series.xml"]:
+        xml_file = XmlFile.from_xml_file(xml_path)
+        serie_id = xml_file.series.index[0]
+        df = xml_file.series[serie_id].df.iloc[:2].copy()
+        df["value"] = [10.5, 20.5]
+        xml_file.series[serie_id].df = df
+        assert 'value="10.5"' in xml_file.series[serie_id].to_str()
+        assert 'value="-1.1' not in xml_file.series[serie_id].to_str()
+
+        xml_file.write(tmp_path / "df_setter.xml", binary=xml_file.is_binary)
+        written = XmlFile.from_xml_file(tmp_path / "df_setter.xml").series[serie_id].df
+        assert written["value"].tolist() == [10.5, 20.5]
+        assert written.index.equals(df.index)
+        (tmp_path / "df_setter.xml").unlink()
+        (tmp_path / "df_setter.bin").unlink(missing_ok=True)
+
+    # Assigning data to a view also replaces the values in the store.
+    serie = xml_file.series.iloc[1]
+    serie.data = serie.data * 2
+    assert np.array_equal(xml_file.series.iloc[1].data, serie.data)
+    assert np.array_equal(xml_file.to_df()[serie.id].to_numpy(), serie.data)
+
+
+def test_xml_file_time_zone(tmp_path):
+    """Test if the PI timeZone is applied to the index and written back"""
+    series = BIN_SERIES.format(location_id="a", unit="minute", multiplier=15, start="06:00:00", end="06:30:00")
+    events = """        <event date="2021-06-22" time="06:00:00" value="1.5"/>
+        <event date="2021-06-22" time="06:15:00" value="2.5"/>
+"""
+    xml_path = tmp_path / "time_zone.xml"
+    xml_str = BIN_XML.format(series.replace("    </series>", events + "    </series>"))
+    xml_path.write_text(xml_str.replace("<timeZone>0.0</timeZone>", "<timeZone>1.0</timeZone>"))
+
+    xml_file = XmlFile.from_xml_file(xml_path)
+    assert xml_file.series.iloc[0].df.index[0] == pd.Timestamp("2021-06-22 05:00", tz="UTC")
+
+    df = XmlFile.from_xml_file(xml_path, tz="Europe/Amsterdam").series.iloc[0].df
+    assert df.index[0] == pd.Timestamp("2021-06-22 07:00", tz="Europe/Amsterdam")
+    assert XmlFile.from_xml_file(xml_path, tz=None).series.iloc[0].df.index[0] == pd.Timestamp("2021-06-22 06:00")
+
+    # Tz-aware window, 05:15 UTC is 06:15 in the file
+    xml_file = XmlFile.from_xml_file(xml_path, start=pd.Timestamp("2021-06-22 05:15", tz="UTC"))
+    assert xml_file.series.iloc[0].df["value"].tolist() == [2.5]
+
+    XmlFile.from_xml_file(xml_path).write(tmp_path / "time_zone_utc.xml")
+    xml_out = (tmp_path / "time_zone_utc.xml").read_text()
+    assert "<timeZone>0.0</timeZone>" in xml_out
+    assert 'time="05:00:00"' in xml_out
+    df_out = XmlFile.from_xml_file(tmp_path / "time_zone_utc.xml").series.iloc[0].df
+    assert df_out.index.equals(XmlFile.from_xml_file(xml_path).series.iloc[0].df.index)
+
+    # A naive index read with tz=None is in the timeZone of the document, it is shifted too
+    XmlFile.from_xml_file(xml_path, tz=None).write(tmp_path / "naive_utc.xml")
+    df_out = XmlFile.from_xml_file(tmp_path / "naive_utc.xml").series.iloc[0].df
+    assert df_out.index.equals(XmlFile.from_xml_file(xml_path).series.iloc[0].df.index)
+
+    # Naive df index, written as it is
+    df = pd.DataFrame({"a": [1.0, 2.0]}, index=pd.DatetimeIndex(["2021-06-22 06:00", "2021-06-22 06:15"]))
+    XmlFile.from_df(df, module_instance_id="m", parameter_id="H", miss_val=-999.0).write(
+        tmp_path / "naive_df.xml", tzone="1.0"
+    )
+    assert 'time="06:00:00"' in (tmp_path / "naive_df.xml").read_text()
+
+    # Without <timeZone> the document is in UTC, a tz-aware window is converted to it
+    xml_path.write_text(xml_str.replace("    <timeZone>0.0</timeZone>\n", ""))
+    xml_file = XmlFile.from_xml_file(xml_path, start=pd.Timestamp("2021-06-22 08:15", tz="Europe/Amsterdam"))
+    assert xml_file.series.iloc[0].df["value"].tolist() == [2.5]
+
+
+def test_xml_file_fractional_seconds(tmp_path):
+    """Test if fractional seconds of event times are read, filtered and written back"""
+    events = """        <event date="2021-06-22" time="06:00:00" value="1.5"/>
+        <event date="2021-06-22" time="06:00:00.500" value="2.5"/>
+"""
+    series = BIN_SERIES.format(location_id="a", unit="minute", multiplier=15, start="06:00:00", end="06:30:00")
+    xml_path = tmp_path / "fraction.xml"
+    xml_path.write_text(BIN_XML.format(series.replace("    </series>", events + "    </series>")))
+
+    serie = XmlFile.from_xml_file(xml_path).series.iloc[0]
+    assert serie.df.index[1] == pd.Timestamp("2021-06-22 06:00:00.500", tz="UTC")
+    xml_file = XmlFile.from_xml_file(xml_path, start=pd.Timestamp("2021-06-22 06:00:00.250"))
+    assert xml_file.series.iloc[0].df["value"].tolist() == [2.5]
+
+    XmlFile.from_xml_file(xml_path).write(tmp_path / "fraction_out.xml")
+    assert 'time="06:00:00.500"' in (tmp_path / "fraction_out.xml").read_text()
+    assert XmlFile.from_xml_file(tmp_path / "fraction_out.xml").series.iloc[0].df.equals(serie.df)
+
+
+def test_xml_file_bin_memmap():
+    """Test if binary values are zero-copy views on the .bin"""
+    xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+    serie = xml_file.series.iloc[1]
+
+    assert not serie.data.flags.writeable
+    assert np.shares_memory(serie.df["value"].to_numpy(), serie.data)
+
+
+def test_xml_file_bin_variable_length(tmp_path):
+    """Test if binary series with different lengths get their own slice of the .bin"""
+    series = [
+        {"location_id": "a", "unit": "minute", "multiplier": 15, "start": "06:00:00", "end": "07:00:00"},
+        {"location_id": "b", "unit": "hour", "multiplier": 1, "start": "06:00:00", "end": "08:00:00"},
+    ]
+    xml_path = tmp_path / "variable.xml"
+    write_bin_xml(xml_path, series=series, values=np.arange(8))
+
+    xml_file = XmlFile.from_xml_file(xml_path)
+
+    assert xml_file.series["b__H.meting__1hour"].data.tolist() == [5, 6, 7]
+    assert xml_file.bin_offsets.loc["b__H.meting__1hour"].tolist() == [5, 8]
+
+    # .bin does not match the headers
+    np.arange(9, dtype=np.float32).tofile(xml_path.with_suffix(".bin"))
+    with pytest.raises(ValueError):
+        XmlFile.from_xml_file(xml_path)
+
+
+def test_xml_file_series_store(tmp_path):
+    """Test if series that share a time axis are stored as one block and the rest as ragged arrays"""
+    series = [
+        {"location_id": "a", "unit": "minute", "multiplier": 15, "start": "06:00:00", "end": "07:00:00"},
+        {"location_id": "b", "unit": "minute", "multiplier": 15, "start": "06:00:00", "end": "07:00:00"},
+        {"location_id": "c", "unit": "hour", "multiplier": 1, "start": "06:00:00", "end": "08:00:00"},
+    ]
+    xml_path = tmp_path / "store.xml"
+    write_bin_xml(xml_path, series=series, values=np.arange(13))
+
+    xml_file = XmlFile.from_xml_file(xml_path)
+    blocks = {block.data.shape: block for block in xml_file.series.time_blocks}
+    assert set(blocks) == {(2, 5), (1, 3)}
+    assert blocks[(2, 5)].ids == ["a__H.meting__15minute", "b__H.meting__15minute"]
+    assert not blocks[(2, 5)].data.flags.owndata  # strided view on the .bin
+    assert xml_file.series.iloc[1].data.tolist() == [5, 6, 7, 8, 9]
+
+    # Replacing a serie keeps its position
+    serie = xml_file.series["a__H.meting__15minute"]
+    serie.data = np.zeros(5, dtype=np.float32)
+    xml_file.series[serie.id] = serie
+    assert xml_file.series.keys()[0] == serie.id
+    assert xml_file.series[serie.id].data.tolist() == [0] * 5
+
+    nonequidistant = XmlFile.from_xml_file("data/normal_test_series.xml").series.iloc[0]
+    nonequidistant.header.time_step = XmlTimeStep(unit="nonequidistant")
+    xml_file.add_time_series(nonequidistant)
+    assert len(xml_file.series.ragged_blocks) == 1
+    assert xml_file.series[nonequidistant.id].df["value"].equals(nonequidistant.df["value"])
+
+
+def test_xml_file_to_df(tmp_path):
+    """Test if series with different time steps are aligned on the union of their indexes"""
+    series = [
+        {"location_id": "a", "unit": "minute", "multiplier": 15, "start": "06:00:00", "end": "07:00:00"},
+        {"location_id": "b", "unit": "hour", "multiplier": 1, "start": "06:00:00", "end": "08:00:00"},
+    ]
+    xml_path = tmp_path / "variable.xml"
+    write_bin_xml(xml_path, series=series, values=np.array([0, 1, -999, 3, 4, 5, 6, -999]))
+
+    xml_file = XmlFile.from_xml_file(xml_path)
+    df = xml_file.to_df(miss_val_to_nan=True)
+    expected = pd.concat([serie.df["value"].rename(serie.id) for serie in xml_file.series], axis=1, sort=True)
+    expected = expected.replace(-999, np.nan)
+
+    assert len(df) == 6
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+    assert df["b__H.meting__1hour"].isna().tolist() == [False, True, True, True, False, True]
+
+
+def test_xml_file_dtype(tmp_path):
+    """Test if float32 values are kept from reading to df and writing"""
+    xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+    assert xml_file.series.iloc[0].df["value"].dtype == np.float32
+    assert xml_file.to_df(miss_val_to_nan=True).dtypes.eq(np.float32).all()
+    assert xml_file.to_df(dtype="float64").dtypes.eq(np.float64).all()
+
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml", dtype="float32")
+    serie = xml_file.series.iloc[0]
+    assert serie.data.dtype == np.float32
+    assert xml_file.to_df(miss_val_to_nan=True).dtypes.eq(np.float32).all()
+
+    xml_file.write(tmp_path / "float32.xml")
+    written = XmlFile.from_xml_file(tmp_path / "float32.xml", dtype="float32")
+    np.testing.assert_array_equal(written.series[serie.id].data, serie.data)
+
+    # Integer series become float when missing values or missing timesteps are NaN.
+    index = pd.date_range("2021-01-01", periods=3, freq="h", tz="UTC")
+    xml_file = XmlFile.from_df(pd.DataFrame({"a": [1, -999, 3]}, index=index), "m", "H.meting", miss_val=-999)
+    assert xml_file.to_df().dtypes.eq(np.int64).all()
+    for df in [xml_file.to_df(miss_val_to_nan=True), xml_file.to_df(miss_val_to_nan=True, dtype="int32")]:
+        values = df.iloc[:, 0].to_numpy()
+        assert values.dtype.kind == "f" and values[[0, 2]].tolist() == [1, 3] and np.isnan(values[1])
+    other = pd.DataFrame({"b": [5, 6]}, index=index[1:] + pd.Timedelta("30min"))
+    other = XmlFile.from_df(other, "m", "H.meting", miss_val=-999)
+    xml_file.add_many(list(other.series))
+    assert xml_file.to_df().dtypes.eq(np.float64).all()
+
+
+def test_xml_file_write_binary(tmp_path):
+    """Test if headers are written to the xml and the values to one float32 .bin"""
+    xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+    xml_file.write(tmp_path / "bin.xml", binary=True)
+    with open(r"data/bin_test_series.bin", "rb") as f:
+        assert (tmp_path / "bin.bin").read_bytes() == f.read()
+    assert XmlFile.from_xml_file(tmp_path / "bin.xml").to_df().equals(xml_file.to_df())
+
+    # NaN is written as missVal, the timestep of a serie with gaps is detected
+    df = pd.DataFrame(
+        {"a": [1.0, np.nan, 3.0], "b": [4.0, 5.0, 6.0]},
+        index=pd.DatetimeIndex(["2021-06-22 06:00", "2021-06-22 06:15", "2021-06-22 06:30"], tz="UTC"),
+    )
+    xml_file = XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=-999.0)
+    gaps = XmlFile.from_df(df.iloc[[0, 2]], module_instance_id="m", parameter_id="Q", miss_val=-999.0)
+    gaps = gaps.series["b__Q__30minute"]
+    gaps.header = replace(gaps.header, time_step=XmlTimeStep(unit="minute", multiplier=10))
+    xml_file.add_time_series(gaps)
+    xml_file.write(tmp_path / "df.xml.gz", binary=True)
+
+    written = XmlFile.from_xml_file(tmp_path / "df.xml.gz")
+    assert written.series["a__H.meting__15minute"].data.tolist() == [1, -999, 3]
+    assert written.series["b__Q__30minute"].df.index.equals(df.index[[0, 2]])
+    irregular = df.set_axis(df.index[[0, 1]].append(df.index[[2]] + pd.Timedelta(minutes=5)))
+    XmlFile.from_df(irregular, module_instance_id="m", parameter_id="Q", miss_val=-999.0).write(
+        tmp_path / "irregular.zip", binary=True
+    )
+    written_irregular = XmlFile.from_xml_file(tmp_path / "irregular.zip")
+    assert written_irregular.series["b__Q__nonequidistant"].df.index.equals(irregular.index)
+
+    written_df = written.to_df(miss_val_to_nan=True)
+    assert written_df.index.equals(xml_file.to_df().index)
+    np.testing.assert_array_equal(written_df.to_numpy(), xml_file.to_df(dtype="float32").to_numpy())
+
+
+def test_xml_file_write_precision(tmp_path):
+    """Test if NaN is written as missVal and the values are rounded to decimals or significant digits"""
+    df = pd.DataFrame(
+        {"a": [1.23456, np.nan, 1234.5]},
+        index=pd.DatetimeIndex(["2021-06-22 06:00", "2021-06-22 06:15", "2021-06-22 06:30"], tz="UTC"),
+    )
+    xml_file = XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=-999.0)
+    xml_file.write(tmp_path / "full.xml")
+    xml_file.write(tmp_path / "decimals.xml", decimals=2)
+    xml_file.write(tmp_path / "significant.xml", significant_digits=3)
+
+    text = (tmp_path / "full.xml").read_text()
+    assert 'value="-999.0"' in text and "nan" not in text
+    assert XmlFile.from_xml_file(tmp_path / "decimals.xml").series.iloc[0].data.tolist() == [1.23, -999, 1234.5]
+    assert XmlFile.from_xml_file(tmp_path / "significant.xml").series.iloc[0].data.tolist() == [1.23, -999, 1230]
+    with pytest.raises(ValueError):
+        xml_file.write(tmp_path / "both.xml", decimals=2, significant_digits=3)
+
+    # A str missVal is written as it is, NaN as missVal as 'NaN' (FEWS does not read 'nan')
+    XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val="-999.0").write(tmp_path / "str.xml")
+    assert (tmp_path / "str.xml").read_text() == text
+    XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val="-999.0").write(
+        tmp_path / "str_bin.xml", binary=True
+    )
+    assert XmlFile.from_xml_file(tmp_path / "str_bin.xml").series.iloc[0].data.tolist()[1] == -999
+    XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=np.nan).write(tmp_path / "nan.xml")
+    text = (tmp_path / "nan.xml").read_text()
+    assert 'value="NaN"' in text and "<missVal>NaN</missVal>" in text and "nan" not in text
+
+    # Columns keep their own dtype, an int column next to a float column is written as int.
+    df = pd.DataFrame({"f": [1.5, 2.5, 3.5], "i": [1, 2, 3], "g": [0.5, 0.5, 0.5]}, index=df.index)
+    xml_file = XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=-999)
+    assert [serie.data.dtype for serie in xml_file.series] == [np.float64, np.int64, np.float64]
+    text = xml_file.series.iloc[1].to_str()
+    assert 'value="1"' in text and 'value="1.0"' not in text
+    assert xml_file.to_df().to_numpy().tolist() == df.to_numpy().tolist()
+
+
+def test_event_templates():
+    """Test if the dates and times of series on the same index are formatted once"""
+    index = pd.date_range("2021-06-22 06:00", periods=4, freq="15min", tz="UTC")
+    df = pd.DataFrame({"a": [1.0, 2.0, 3.0, 4.0], "b": [5.0, 6.0, 7.0, 8.0]}, index=index)
+    xml_file = XmlFile.from_df(df, module_instance_id="m", parameter_id="H.meting", miss_val=-999.0)
+
+    templates = EventTemplates()
+    for serie in xml_file.series:
+        assert list(serie.iter_events(templates=templates)) == list(serie.iter_events())
+    assert len(templates._templates) == 1
+    template = templates.get(index.tz_localize(None))
+    assert templates.get(index.tz_localize(None).copy()) is template
+    assert templates.get(index[:3].tz_localize(None)) is not template
+
+    # The least recently used template is dropped
+    templates = EventTemplates(max_bytes=1)
+    templates.get(index[:3].tz_localize(None))
+    templates.get(index.tz_localize(None))
+    assert len(templates._templates) == 1
+
+
+def test_xml_file_write_parts(tmp_path):
+    """Test if the output is split by number of events or bytes, with a manifest of the parts"""
+    xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+    manifest = xml_file.write(tmp_path / "bin.xml", binary=True, max_events_per_file=1002, workers=2)
+    assert [part["events"] for part in manifest["parts"]] == [1002, 1002, 1002, 534]
+    assert (tmp_path / "bin.manifest.json").exists()
+
+    # The 201st serie is split in time, 2 events in the first part and 3 in the second.
+    parts = [XmlFile.from_xml_file(tmp_path / part["path"]) for part in manifest["parts"]]
+    split = manifest["parts"][0]["series"][-1]
+    assert split["events"] == 2 and manifest["parts"][1]["series"][0]["id"] == split["id"]
+    values = np.concatenate([parts[0].series[split["id"]].data, parts[1].series[split["id"]].data])
+    np.testing.assert_array_equal(values, xml_file.series[split["id"]].data)
+    assert sum(part.to_df().sum().sum() for part in parts) == pytest.approx(xml_file.to_df().sum().sum())
+
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml")
+    manifest = xml_file.write(tmp_path / "normal.xml", max_bytes_per_file=1_000)
+    sizes = [(tmp_path / part["path"]).stat().st_size for part in manifest["parts"]]
+    assert len(sizes) > 1 and max(sizes) < 1_100
+    with pytest.raises(FileExistsError):
+        xml_file.write(tmp_path / "normal.xml", max_bytes_per_file=1_000)
+
+
+def test_xml_file_compressed(tmp_path):
+    """Test if gzip and zip compressed xml (and .bin) are read and written without temporary files"""
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml")
+    df = xml_file.to_df()
+
+    xml_file.write(tmp_path / "normal.xml.gz")
+    xml_file.write(tmp_path / "normal.zip")
+    assert XmlFile.from_xml_file(tmp_path / "normal.xml.gz").to_df().equals(df)
+    assert XmlFile.from_xml_file(tmp_path / "normal.zip").to_df().equals(df)
+    with gzip.open(tmp_path / "normal.xml.gz") as f:
+        assert f.read(5) == b"<?xml"
+
+    # Binary xml with a gzipped .bin next to it
+    bin_df = XmlFile.from_xml_file(r"data/bin_test_series.xml").to_df()
+    with open(r"data/bin_test_series.xml", "rb") as src, gzip.open(tmp_path / "bin.xml.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    with open(r"data/bin_test_series.bin", "rb") as src, gzip.open(tmp_path / "bin.bin.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    assert XmlFile.from_xml_file(tmp_path / "bin.xml.gz").to_df().equals(bin_df)
+
+    # Zip bundle of a binary and a non-binary xml
+    series = BIN_SERIES.format(location_id="a", unit="minute", multiplier=15, start="06:00:00", end="06:15:00")
+    events = """        <event date="2021-06-22" time="06:00:00" value="1.5"/>
+        <event date="2021-06-22" time="06:15:00" value="2.5"/>
+"""
+    with zipfile.ZipFile(tmp_path / "bundle.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(r"data/bin_test_series.xml", "bin.xml")
+        archive.write(r"data/bin_test_series.bin", "bin.bin")
+        archive.writestr("events.xml", BIN_XML.format(series.replace("    </series>", events + "    </series>")))
+    bundle = XmlFile.from_xml_file(tmp_path / "bundle.zip")
+    assert bundle.to_df(dtype="float32")[bin_df.columns].equals(bin_df)
+    assert bundle.series["a__H.meting__15minute"].data.tolist() == [1.5, 2.5]
+    with pytest.raises(ValueError):
+        XmlFile.read_series(tmp_path / "bundle.zip")
+
+
+def test_xml_file_from_bytes():
+    """Test if xml and .bin are read from memory, the values are a view on the bin buffer"""
+    xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+    with open(r"data/bin_test_series.xml", "rb") as f:
+        xml_bytes = f.read()
+    bin_buffer = bytearray(np.fromfile(r"data/bin_test_series.bin", dtype=np.uint8))
+
+    from_bytes = XmlFile.from_bytes(xml_bytes, bin_bytes=bin_buffer)
+    assert from_bytes.to_df().equals(xml_file.to_df())
+    assert from_bytes.bin_offsets.equals(xml_file.bin_offsets)
+    assert np.shares_memory(from_bytes.series.iloc[0].data, np.frombuffer(bin_buffer, dtype=np.float32))
+
+    from_buffer = XmlFile.from_buffer(memoryview(xml_bytes), bin_buffer=bin_buffer, location_ids="union_8020 AE2")
+    assert from_buffer.series.keys() == ["union_8020 AE2__H.meting__900second"]
+
+    with open(r"data/normal_test_series.xml", "rb") as f:
+        from_stream = XmlFile.from_stream(f)
+    assert from_stream.to_df().equals(XmlFile.from_xml_file(r"data/normal_test_series.xml").to_df())
+
+    # A document without the PI namespace
+    no_namespace = XmlFile.from_bytes(
+        xml_bytes.replace(b' xmlns="http://www.wldelft.nl/fews/PI"', b""), bin_bytes=bin_buffer
+    )
+    assert no_namespace.to_df().equals(xml_file.to_df())
+    with open(r"data/normal_test_series.xml", "rb") as f:
+        no_namespace = XmlFile.from_bytes(f.read().replace(b'xmlns="http://www.wldelft.nl/fews/PI"', b""))
+    assert no_namespace.to_df().equals(from_stream.to_df())
+
+
+def test_xml_file_headers():
+    """Test the header catalogue and selection of series on header fields"""
+    xml_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+    headers = xml_file.headers
+
+    assert len(headers) == 708
+    assert headers.index[0] == xml_file.series.keys()[0]
+    assert headers["parameter_id"].dtype == "category"
+    assert headers["start_date"].dtype == "datetime64[ns]"
+    assert xml_file.series__start_date == datetime.datetime(2021, 6, 22, 6)
+    assert xml_file.headers is headers  # cached
+
+    selection = xml_file.select(parameter_id="H.meting", location_id=["union_8020 AE2", "union_GPG-E-6001"])
+    assert list(selection.series.index) == [
+        "union_8020 AE2__H.meting__900second",
+        "union_GPG-E-6001__H.meting__900second",
+    ]
+    assert np.shares_memory(selection.series.iloc[0].data, xml_file.series["union_8020 AE2__H.meting__900second"].data)
+    assert selection.to_df().equals(xml_file.to_df()[selection.series.keys()])
+    with pytest.raises(ValueError):
+        xml_file.select(location="a")
+
+    # Rows of added series are appended to the cached catalogue
+    serie = selection.series.iloc[0]
+    serie.header = replace(serie.header, location_id="new", units="m")
+    xml_file.add_time_series(serie)
+    assert xml_file.headers.loc["new__H.meting__900second", "units"] == "m"
+    assert xml_file.headers["units"].dtype == "category"
+    assert len(selection.headers) == 2
+
+
+def test_xml_file_add_many():
+    """Test if add_many checks all ids before adding a serie"""
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml")
+    series = list(xml_file.series)
+
+    new_file = XmlFile(xml_path=None)
+    assert new_file.add_many(series[:2]) == xml_file.series.keys()[:2]
+    with pytest.raises(ValueError, match=series[1].id):
+        new_file.add_many(series[2:] + series[1:2])
+    with pytest.raises(ValueError):
+        XmlFile(xml_path=None).add_many([series[2], series[2]])
+    assert len(new_file.series) == 2
+
+
+def test_xml_file_filtered():
+    """Test if we can read a selection of series and a time window"""
+    xml_file = XmlFile.from_xml_file(
+        r"data/bin_test_series.xml",
+        location_ids=["union_GPG-E-6001", "union_8020 AE2"],
+        start="2021-06-22 06:10",
+        end="2021-06-22 06:45",
+    )
+    full_file = XmlFile.from_xml_file(r"data/bin_test_series.xml")
+
+    assert len(xml_file.series) == 2
+    serie = xml_file.series["union_GPG-E-6001__H.meting__900second"]
+    full_df = full_file.series["union_GPG-E-6001__H.meting__900second"].df
+    assert serie.df.index.strftime("%H:%M").tolist() == ["06:15", "06:30", "06:45"]
+    assert serie.df["value"].tolist() == full_df["value"].iloc[1:4].tolist()
+
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml", parameter_ids="H.meting", end="2021-06-22 06:15")
+    assert len(xml_file.series) == 3
+    assert len(xml_file.series.iloc[0].df) == 2
+
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml", location_ids="union_8020 AE2", start="2022-01-01")
+    assert len(xml_file.series) == 0
+
+
+def test_xml_file_empty_series(tmp_path):
+    """Test if series without events are kept, unless a time window is set"""
+    empty = BIN_SERIES.format(location_id="empty", unit="second", multiplier=900, start="06:00:00", end="07:00:00")
+    xml_path = tmp_path / "empty.xml"
+    xml_path.write_text(
+        Path("data/normal_test_series.xml").read_text().replace("</TimeSeries>", f"{empty}</TimeSeries>")
+    )
+
+    for workers in [None, 2]:
+        xml_file = XmlFile.from_xml_file(xml_path, workers=workers)
+        assert len(xml_file.series) == 4
+        assert len(xml_file.series["empty__H.meting__900second"].data) == 0
+        assert "empty" in xml_file.headers["location_id"].tolist()
+    assert len(XmlFile.from_xml_file(xml_path, start="2021-06-22 06:30").series) == 3
+
+
+def test_xml_file_read_series(tmp_path):
+    """Test if we can read a selection of series through the sidecar index"""
+    for suffix in [".xml", ".bin"]:
+        shutil.copy(f"data/bin_test_series{suffix}", tmp_path / f"bin_test_series{suffix}")
+    xml_path = tmp_path / "bin_test_series.xml"
+
+    xml_file = XmlFile.read_series(xml_path, location_id=["union_GPG-E-6001", "union_8020 AE2"])
+    assert (tmp_path / "bin_test_series.xml.idx").exists()
+
+    # Index is reused on the second read
+    xml_file = XmlFile.read_series(xml_path, location_id=["union_GPG-E-6001", "union_8020 AE2"])
+    full_file = XmlFile.from_xml_file(xml_path)
+    assert list(xml_file.series.index) == [
+        "union_8020 AE2__H.meting__900second",
+        "union_GPG-E-6001__H.meting__900second",
+    ]
+    for serie_id, serie in xml_file.series.items():
+        assert serie.data.tolist() == full_file.series[serie_id].data.tolist()
+
+    # A truncated .bin raises, like from_xml_file
+    bin_path = tmp_path / "bin_test_series.bin"
+    bin_path.write_bytes(bin_path.read_bytes()[:400])
+    with pytest.raises(ValueError, match="bin values"):
+        XmlFile.read_series(xml_path, location_id="union_8020 AE2")
+
+    shutil.copy("data/normal_test_series.xml", tmp_path / "normal_test_series.xml")
+    xml_file = XmlFile.read_series(tmp_path / "normal_test_series.xml", location_id="union_Waddenzeedijk 1")
+    assert xml_file.series.iloc[0].df["value"].iloc[0] == -0.37299999594688416
+
+
+def test_xml_file_from_directory(tmp_path):
+    """Test if we can read a directory of xml files in parallel"""
+    for suffix in [".xml", ".bin"]:
+        shutil.copy(f"data/bin_test_series{suffix}", tmp_path / f"bin_test_series{suffix}")
+    shutil.copy("data/normal_test_series.xml", tmp_path / "normal_test_series.xml")
+
+    # The normal xml has the same series as the binary xml
+    with pytest.raises(ValueError):
+        XmlFile.from_directory(tmp_path, workers=2)
+
+    xml_file = XmlFile.from_directory(tmp_path, workers=2, on_duplicate="first")
+    assert len(xml_file.series) == 708
+    assert int(xml_file.to_df().sum().sum()) == -337126
+
+    xml_file = XmlFile.from_directory(tmp_path, workers=2, on_duplicate="last")
+    serie = xml_file.series["union_8020 AE2__H.meting__900second"]
+    assert serie.event_columns["flag"].tolist() == [0, 0, 0, 0, 0]
+    assert serie.df["value"].iloc[0] == -1.1059999465942383
+
+
+def test_xml_file_workers():
+    """Test if parsing a normal xml in parallel chunks gives the same result"""
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml", workers=2)
+    full_file = XmlFile.from_xml_file(r"data/normal_test_series.xml")
+
+    assert list(xml_file.series.index) == list(full_file.series.index)
+    assert xml_file.to_df().equals(full_file.to_df())
+    assert [s.header for s in xml_file.series] == [s.header for s in full_file.series]
+
+    xml_file = XmlFile.from_xml_file(r"data/normal_test_series.xml", workers=2, location_ids="union_GPG-E-6001")
+    assert list(xml_file.series.index) == ["union_GPG-E-6001__H.meting__900second"]
+
+
+def test_split_series_chunks():
+    """Test if a large serie does not pull the following series into its chunk"""
+
+    def boundaries(sizes):
+        stops = np.cumsum(sizes)
+        return np.stack([stops - sizes, stops], axis=1)
+
+    assert split_series_chunks(boundaries([1000, 10, 10, 10]), n_chunks=2) == [(0, 1000), (1000, 1030)]
+    assert split_series_chunks(boundaries([10, 10, 10, 1000]), n_chunks=2) == [(0, 30), (30, 1030)]
+    assert split_series_chunks(boundaries([10, 10, 10, 10]), n_chunks=2) == [(0, 20), (20, 40)]
+    assert split_series_chunks(boundaries([10]), n_chunks=3) == [(0, 10)]
+
+
+def test_xml_file_iter_series():
+    """Test if we can stream the series of a binary xml file"""
+    series = list(XmlFile.iter_series(r"data/bin_test_series.xml"))
+
+    assert len(series) == 708
+    assert series[0].id == "union_8020 AE2__H.meting__900second"
+    assert int(sum(serie.df["value"].sum() for serie in series)) == -337126
+
+
 # %%
 if __name__ == "__main__":
     test_xml_header()